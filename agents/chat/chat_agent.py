@@ -3,8 +3,12 @@ Chat Agent for Multi-hop Research
 Main chat agent that orchestrates chat functionality with research capabilities.
 """
 
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+from collections import OrderedDict
 from datetime import datetime, timezone
+import asyncio
+import re
+import threading
 from ..shared.interfaces import IAgent
 from ..shared.models import ResearchResult, ChatResponse, ChatMessage, Conversation
 from ..shared.exceptions import AgentError, ConversationError
@@ -13,6 +17,55 @@ from .context_builder import ContextBuilder
 from .response_generator import ResponseGenerator
 
 
+# Maximum length of generated conversation titles, including the ellipsis
+TITLE_MAX_LENGTH = 30
+
+
+# Leading words skipped when titling a question
+QUESTION_WORDS = frozenset({'what', 'how', 'why', 'when', 'where', 'who', 'can', 'could', 'would', 'should'})
+
+# Matches the run of leading question words, so titles skip them without splitting
+QUESTION_PREFIX_PATTERN = re.compile(
+    r'(?:(?:' + '|'.join(sorted(QUESTION_WORDS)) + r')\s+)+',
+    re.IGNORECASE
+)
+
+# Topics worth naming a conversation after
+IMPORTANT_KEYWORDS = (
+    'machine learning', 'artificial intelligence', 'ai', 'ml', 'data science',
+    'programming', 'python', 'javascript', 'react', 'database', 'sql',
+    'algorithm', 'neural network', 'deep learning', 'nlp', 'computer vision'
+)
+
+# Single-pass matcher for the first important keyword, longest alternatives first
+IMPORTANT_KEYWORD_PATTERN = re.compile(
+    r'\b(?:' + '|'.join(re.escape(k) for k in sorted(IMPORTANT_KEYWORDS, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+# Titles considered placeholders that should be replaced
+GENERIC_TITLES = frozenset({
+    "new conversation", "conversation", "chat", "untitled",
+    "untitled conversation", "new chat", "chat session"
+})
+
+
+# Maximum number of research results kept for follow-up suggestions
+RESEARCH_RESULT_CACHE_SIZE = 256
+
+# Research results by assistant message ID, so follow-ups skip rebuilding them from metadata
+_research_results: "OrderedDict[str, ResearchResult]" = OrderedDict()
+_research_results_lock = threading.Lock()
+
+# Response generation is stateless, so every chat agent shares one generator
+_response_generator = ResponseGenerator()
+
+
+def _make_title(text: str, max_length: int = TITLE_MAX_LENGTH) -> str:
+    """Truncate text to a title of at most max_length characters."""
+    return text if len(text) <= max_length else text[:max_length - 3] + "..."
+
+
 class ChatAgent(IAgent):
     """
     Chat agent that extends research capabilities with conversation management.
@@ -29,7 +82,7 @@ class ChatAgent(IAgent):
         self.research_agent = research_agent
         self.conversation_manager = conversation_manager or ConversationManager()
         self.context_builder = ContextBuilder()
-        self.response_generator = ResponseGenerator()
+        self.response_generator = _response_generator
     
     def process(self, message: str, conversation_id: Optional[str] = None, 
                 per_sub_k: int = 3, include_context: bool = True) -> ChatResponse:
@@ -56,26 +109,31 @@ class ChatAgent(IAgent):
             if not conversation:
                 raise ConversationError(f"Conversation {conversation_id} not found")
             
-            # Add user message to conversation
+            # Update conversation title if this is one of the first few messages
+            # and the current title is generic
+            new_title = None
+            if len(conversation.messages) <= 3 and self._is_generic_title(conversation.title):
+                generated_title = self._generate_conversation_title_from_conversation(conversation)
+                if generated_title != conversation.title:
+                    new_title = generated_title
+            
+            # Add user message to conversation, saving any new title in the same commit
             user_message = self.conversation_manager.add_message(
                 conversation_id, 
                 "user", 
                 message,
-                metadata={"per_sub_k": per_sub_k}
+                metadata={"per_sub_k": per_sub_k},
+                title=new_title
             )
-            
-            # Update conversation title if this is one of the first few messages
-            # and the current title is generic
-            if len(conversation.messages) <= 3 and self._is_generic_title(conversation.title):
-                new_title = self._generate_conversation_title_from_conversation(conversation)
-                if new_title != conversation.title:
-                    self.conversation_manager.update_conversation_title(conversation_id, new_title)
-                    conversation.title = new_title
+            if new_title:
+                conversation.title = new_title
             
             # Build context for research
             research_context = {}
             if include_context:
-                research_context = self.context_builder.build_research_context(conversation)
+                research_context = self.context_builder.build_research_context(
+                    conversation, include_messages=False
+                )
             
             # Perform research with context
             try:
@@ -92,38 +150,47 @@ class ChatAgent(IAgent):
                     research_result, research_context
                 )
                 
+                # Serialize the research result once for storage and the response
+                research_result_dict = research_result.to_dict()
+                
                 # Add assistant message to conversation
                 assistant_message = self.conversation_manager.add_message(
                     conversation_id,
                     "assistant",
                     chat_response,
                     metadata={
-                        "research_result": research_result.to_dict(),
-                        "subqueries": [sq.__dict__ for sq in research_result.subqueries],
+                        "research_result": research_result_dict,
                         "citations_count": len(research_result.citations),
                         "total_documents": research_result.total_documents
                     }
                 )
                 
+                with _research_results_lock:
+                    _research_results[assistant_message.id] = research_result
+                    if len(_research_results) > RESEARCH_RESULT_CACHE_SIZE:
+                        _research_results.popitem(last=False)
+                
                 return ChatResponse(
                     conversation_id=conversation_id,
                     message_id=assistant_message.id,
                     answer=chat_response,
                     conversation_title=conversation.title,
                     message_count=len(conversation.messages),
-                    context_used=bool(research_context.get('recent_messages')),
+                    context_used=research_context.get('recent_messages_count', 0) > 0,
                     timestamp=assistant_message.timestamp.isoformat(),
-                    research_result=research_result
+                    research_result=research_result,
+                    research_result_dict=research_result_dict
                 )
                 
             except Exception as e:
                 # Add error message to conversation
-                error_message = f"I encountered an error while researching your question: {str(e)}"
+                error_text = str(e)
+                error_message = f"I encountered an error while researching your question: {error_text}"
                 self.conversation_manager.add_message(
                     conversation_id,
                     "assistant",
                     error_message,
-                    metadata={"error": str(e), "error_type": type(e).__name__}
+                    metadata={"error": error_text, "error_type": type(e).__name__}
                 )
                 
                 return ChatResponse(
@@ -134,11 +201,31 @@ class ChatAgent(IAgent):
                     message_count=len(conversation.messages),
                     context_used=False,
                     timestamp=datetime.now(timezone.utc).isoformat(),
-                    error=str(e)
+                    error=error_text
                 )
                 
         except Exception as e:
-            raise AgentError(f"Failed to process chat message: {str(e)}")
+            raise AgentError(f"Failed to process chat message: {e}") from e
+    
+    async def aprocess(self, message: str, conversation_id: Optional[str] = None,
+                       per_sub_k: int = 3, include_context: bool = True) -> ChatResponse:
+        """
+        Process a chat message without blocking the event loop.
+        
+        The turn runs in a worker thread, so other requests are served while
+        research waits on the retriever and LLM. The steps of one turn share a
+        database session and still run in order.
+        
+        Args:
+            message: User's message
+            conversation_id: ID of the conversation (creates new if None)
+            per_sub_k: Number of documents per subquery
+            include_context: Whether to include conversation context
+            
+        Returns:
+            ChatResponse with answer and conversation info
+        """
+        return await asyncio.to_thread(self.process, message, conversation_id, per_sub_k, include_context)
     
     def chat_ask(self, question: str, conversation_id: Optional[str] = None, 
                  per_sub_k: int = 3, include_context: bool = True) -> Dict[str, Any]:
@@ -162,7 +249,7 @@ class ChatAgent(IAgent):
             "conversation_id": response.conversation_id,
             "question": question,
             "answer": response.answer,
-            "research_result": response.research_result.to_dict() if response.research_result else None,
+            "research_result": response.research_result_to_dict(),
             "message_id": response.message_id,
             "conversation_title": response.conversation_title,
             "message_count": response.message_count,
@@ -176,9 +263,10 @@ class ChatAgent(IAgent):
         messages = self.conversation_manager.get_conversation_history(conversation_id, max_messages)
         return [msg.to_dict() for msg in messages]
     
-    def list_conversations(self) -> List[Dict[str, Any]]:
-        """List all conversations."""
-        return self.conversation_manager.list_conversations()
+    def list_conversations(self, limit: Optional[int] = None,
+                           before: Optional[Tuple[datetime, str]] = None) -> List[Dict[str, Any]]:
+        """List conversations, optionally one keyset page at a time."""
+        return self.conversation_manager.list_conversations(limit=limit, before=before)
     
     def create_conversation(self, title: str = "New Conversation") -> str:
         """Create a new conversation."""
@@ -202,19 +290,16 @@ class ChatAgent(IAgent):
     
     def generate_follow_up_suggestions(self, conversation_id: str) -> List[str]:
         """Generate follow-up question suggestions for a conversation."""
-        conversation = self.conversation_manager.get_conversation(conversation_id)
-        if not conversation or not conversation.messages:
-            return []
-        
         # Get the last assistant message with research result
-        for msg in reversed(conversation.messages):
-            if msg.role == "assistant" and msg.metadata and "research_result" in msg.metadata:
-                research_data = msg.metadata["research_result"]
-                # Convert back to ResearchResult object
-                research_result = ResearchResult(**research_data)
-                return self.response_generator.generate_follow_up_suggestions(research_result)
+        message = self.conversation_manager.get_last_research_message(conversation_id)
+        if not message:
+            return []
         
-        return []
+        with _research_results_lock:
+            research_result = _research_results.get(message.id)
+        if research_result is None:
+            research_result = ResearchResult.from_dict(message.metadata["research_result"])
+        return self.response_generator.generate_follow_up_suggestions(research_result)
     
     def _generate_conversation_title(self, message: str) -> str:
         """
@@ -230,49 +315,33 @@ class ChatAgent(IAgent):
         clean_message = message.strip()
         
         # If message is very short, use it as-is
-        if len(clean_message) <= 30:
+        if len(clean_message) <= TITLE_MAX_LENGTH:
             return clean_message
         
         # If message is a question, try to extract the key part
         if clean_message.endswith('?'):
             # Remove common question words and extract the main topic
-            question_words = ['what', 'how', 'why', 'when', 'where', 'who', 'can', 'could', 'would', 'should']
-            words = clean_message.lower().split()
+            match = QUESTION_PREFIX_PATTERN.match(clean_message)
+            remaining = clean_message[match.end():] if match else clean_message
+            remaining = remaining.lower()
             
-            # Find the first non-question word
-            for i, word in enumerate(words):
-                if word not in question_words:
-                    # Take from this word onwards, up to 30 characters
-                    remaining = ' '.join(words[i:])
-                    if len(remaining) <= 30:
-                        return remaining.capitalize()
-                    else:
-                        return remaining[:27] + "..."
+            # Take the rest of the question, up to the title length
+            if len(remaining) <= TITLE_MAX_LENGTH:
+                return remaining.capitalize()
+            return _make_title(remaining)
         
         # For non-questions, try to extract key terms
-        # Look for technical terms or important keywords
-        important_keywords = [
-            'machine learning', 'artificial intelligence', 'ai', 'ml', 'data science',
-            'programming', 'python', 'javascript', 'react', 'database', 'sql',
-            'algorithm', 'neural network', 'deep learning', 'nlp', 'computer vision'
-        ]
-        
-        message_lower = clean_message.lower()
-        for keyword in important_keywords:
-            if keyword in message_lower:
-                # Find the position of the keyword and extract surrounding context
-                pos = message_lower.find(keyword)
-                start = max(0, pos - 10)
-                end = min(len(clean_message), pos + len(keyword) + 20)
-                extracted = clean_message[start:end].strip()
-                
-                if len(extracted) <= 30:
-                    return extracted
-                else:
-                    return extracted[:27] + "..."
-        
-        # Fallback: use first 30 characters
-        return clean_message[:27] + "..." if len(clean_message) > 30 else clean_message
+        # Look for the first technical term or important keyword
+        match = IMPORTANT_KEYWORD_PATTERN.search(clean_message)
+        if match:
+            # Extract the keyword with some surrounding context
+            pos = match.start()
+            start = max(0, pos - 10)
+            end = min(len(clean_message), match.end() + 20)
+            return _make_title(clean_message[start:end].strip())
+        
+        # Fallback: use the start of the message
+        return _make_title(clean_message)
     
     def _is_generic_title(self, title: str) -> bool:
         """
@@ -284,12 +353,8 @@ class ChatAgent(IAgent):
         Returns:
             True if the title is generic
         """
-        generic_titles = [
-            "new conversation", "conversation", "chat", "untitled",
-            "untitled conversation", "new chat", "chat session"
-        ]
-        
-        return title.lower().strip() in generic_titles or len(title.strip()) < 5
+        stripped = title.strip()
+        return stripped.lower() in GENERIC_TITLES or len(stripped) < 5
     
     def _generate_conversation_title_from_conversation(self, conversation: Conversation) -> str:
         """
@@ -311,15 +376,13 @@ class ChatAgent(IAgent):
         if theme and theme != "General conversation":
             return theme.title()
         
-        # Otherwise, try to generate from user messages
-        user_messages = [msg for msg in conversation.messages if msg.role == 'user']
+        # Otherwise, use the first user message to generate title
+        user_messages = conversation.get_first_user_messages(1)
         
         if not user_messages:
             return "New Conversation"
         
-        # Use the first user message to generate title
-        first_message = user_messages[0].content
-        return self._generate_conversation_title(first_message)
+        return self._generate_conversation_title(user_messages[0].content)
 
 
 if __name__ == "__main__":
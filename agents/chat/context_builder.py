@@ -3,10 +3,48 @@ Context Builder for Chat Agent
 Handles building context from conversation history for research.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Hashable, Tuple
+from collections import Counter, OrderedDict
+import re
+import threading
 from ..shared.models import Conversation, ChatMessage
 
 
+# Maximum number of conversation revisions whose research context is cached
+CONTEXT_CACHE_SIZE = 256
+
+# Research contexts keyed by conversation revision, shared across per-request builders
+_context_cache: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+_context_cache_lock = threading.Lock()
+
+# Maximum number of messages whose rendered context fragment is cached
+FRAGMENT_CACHE_SIZE = 4096
+
+# Rendered (fragment, topics) per message ID; stored messages never change
+_fragment_cache: "OrderedDict[str, Tuple[str, Tuple[str, ...]]]" = OrderedDict()
+_fragment_cache_lock = threading.Lock()
+
+# Theme keywords matched in a single pass over each user message
+THEME_PATTERN = re.compile(
+    r'\b(machine learning|ml|artificial intelligence|ai|data science|programming|code|research)\b',
+    re.IGNORECASE
+)
+
+# Theme label for keywords that are not labels themselves
+THEME_ALIASES = {
+    'ml': 'machine learning',
+    'ai': 'artificial intelligence',
+    'code': 'programming'
+}
+
+# Maximum number of conversation themes cached
+THEME_CACHE_SIZE = 1024
+
+# Themes keyed by the IDs of the user messages they were derived from
+_theme_cache: "OrderedDict[Tuple[str, ...], str]" = OrderedDict()
+_theme_cache_lock = threading.Lock()
+
+
 class ContextBuilder:
     """
     Context builder that extracts relevant information from conversation history.
@@ -21,12 +59,15 @@ class ContextBuilder:
         """
         self.max_context_messages = max_context_messages
     
-    def build_research_context(self, conversation: Conversation) -> Dict[str, Any]:
+    def build_research_context(self, conversation: Conversation,
+                               include_messages: bool = True) -> Dict[str, Any]:
         """
         Build context from conversation history for research.
         
         Args:
             conversation: The conversation to build context from
+            include_messages: Whether to include the serialized recent messages;
+                recent_messages_count is always present
             
         Returns:
             Dictionary containing context information
@@ -34,23 +75,61 @@ class ContextBuilder:
         if not conversation or not conversation.messages:
             return {}
         
+        # Reuse the context built for this exact conversation revision
+        cache_key = self._revision_key(conversation)
+        with _context_cache_lock:
+            cached = _context_cache.get(cache_key)
+            if cached is not None:
+                _context_cache.move_to_end(cache_key)
+        
+        if cached is None:
+            cached = self._build_research_context(conversation)
+            with _context_cache_lock:
+                _context_cache[cache_key] = cached
+                if len(_context_cache) > CONTEXT_CACHE_SIZE:
+                    _context_cache.popitem(last=False)
+        
+        context = dict(cached)
+        if include_messages:
+            context["recent_messages"] = self.get_recent_messages_dicts(conversation)
+        return context
+    
+    def get_recent_messages_dicts(self, conversation: Conversation) -> List[Dict[str, Any]]:
+        """
+        Serialize the recent messages used for research context.
+        
+        Args:
+            conversation: The conversation to read messages from
+            
+        Returns:
+            List of message dictionaries
+        """
+        return [msg.to_dict() for msg in conversation.get_recent_context(self.max_context_messages)]
+    
+    def _revision_key(self, conversation: Conversation) -> Hashable:
+        """Identify a conversation revision; changes whenever a message is added."""
+        return (
+            conversation.id,
+            len(conversation.messages),
+            conversation.messages[-1].id,
+            conversation.updated_at,
+            self.max_context_messages
+        )
+    
+    def _build_research_context(self, conversation: Conversation) -> Dict[str, Any]:
+        """Build the research context without consulting the cache."""
         # Get recent messages
         recent_messages = conversation.get_recent_context(self.max_context_messages)
         
-        # Extract relevant information from recent messages
+        # Collect the pre-rendered fragment of each recent message
         context_summary = []
         research_topics = []
         
         for msg in recent_messages:
-            if msg.role == 'user':
-                context_summary.append(f"Previous question: {msg.content}")
-            elif msg.role == 'assistant' and msg.metadata and 'research_result' in msg.metadata:
-                # Extract key topics from previous research
-                research_result = msg.metadata['research_result']
-                if 'subqueries' in research_result:
-                    topics = [sq.get('subquery', '') for sq in research_result['subqueries']]
-                    research_topics.extend(topics[:2])  # Top 2 topics per research
-                    context_summary.append(f"Previously researched: {'; '.join(topics[:2])}")
+            fragment, topics = self._message_fragment(msg)
+            if fragment:
+                context_summary.append(fragment)
+                research_topics.extend(topics)
         
         return {
             "conversation_id": conversation.id,
@@ -58,9 +137,43 @@ class ContextBuilder:
             "recent_context": ' '.join(context_summary),
             "research_topics": research_topics,
             "message_count": len(conversation.messages),
-            "recent_messages": [msg.to_dict() for msg in recent_messages]
+            "recent_messages_count": len(recent_messages)
         }
     
+    def _message_fragment(self, msg: ChatMessage) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Render a message's contribution to the research context, memoized per message ID.
+        
+        Args:
+            msg: Conversation message
+            
+        Returns:
+            Tuple of (context fragment, research topics); the fragment is empty
+            for messages that add nothing to the context
+        """
+        with _fragment_cache_lock:
+            cached = _fragment_cache.get(msg.id)
+            if cached is not None:
+                _fragment_cache.move_to_end(msg.id)
+                return cached
+        
+        fragment, topics = "", ()
+        if msg.role == 'user':
+            fragment = f"Previous question: {msg.content}"
+        elif msg.role == 'assistant' and msg.metadata and 'research_result' in msg.metadata:
+            # Extract key topics from previous research
+            research_result = msg.metadata['research_result']
+            if 'subqueries' in research_result:
+                topics = tuple(sq.get('subquery', '') for sq in research_result['subqueries'][:2])  # Top 2 topics per research
+                fragment = f"Previously researched: {'; '.join(topics)}"
+        
+        with _fragment_cache_lock:
+            _fragment_cache[msg.id] = (fragment, topics)
+            if len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+                _fragment_cache.popitem(last=False)
+        
+        return fragment, topics
+    
     def enhance_question_with_context(self, question: str, context: Dict[str, Any]) -> str:
         """
         Enhance the question with conversation context.
@@ -89,18 +202,14 @@ class ContextBuilder:
         Returns:
             List of research topics
         """
-        topics = []
-        
-        for msg in conversation.messages:
-            if msg.role == 'assistant' and msg.metadata and 'research_result' in msg.metadata:
-                research_result = msg.metadata['research_result']
-                if 'subqueries' in research_result:
-                    for sq in research_result['subqueries']:
-                        if 'subquery' in sq:
-                            topics.append(sq['subquery'])
-        
-        # Remove duplicates and return
-        return list(dict.fromkeys(topics))
+        # Stream subqueries straight into the de-duplicating dict
+        return list(dict.fromkeys(
+            sq['subquery']
+            for msg in conversation.messages
+            if msg.role == 'assistant' and msg.metadata and 'research_result' in msg.metadata
+            for sq in msg.metadata['research_result'].get('subqueries', ())
+            if 'subquery' in sq
+        ))
     
     def get_conversation_theme(self, conversation: Conversation) -> str:
         """
@@ -115,32 +224,45 @@ class ContextBuilder:
         if not conversation or not conversation.messages:
             return "General conversation"
         
-        # Get user messages to determine theme
-        user_messages = [msg for msg in conversation.messages if msg.role == 'user']
+        # Get the first few user messages to determine theme
+        user_messages = conversation.get_first_user_messages(3)
         
         if not user_messages:
             return "General conversation"
         
-        # Simple theme extraction based on first few user messages
+        # The theme only changes while the first 3 user messages are still arriving
+        cache_key = tuple(msg.id for msg in user_messages)
+        with _theme_cache_lock:
+            theme = _theme_cache.get(cache_key)
+            if theme is not None:
+                _theme_cache.move_to_end(cache_key)
+                return theme
+        
+        theme = self._extract_theme(user_messages)
+        
+        with _theme_cache_lock:
+            _theme_cache[cache_key] = theme
+            if len(_theme_cache) > THEME_CACHE_SIZE:
+                _theme_cache.popitem(last=False)
+        
+        return theme
+    
+    def _extract_theme(self, user_messages: List[ChatMessage]) -> str:
+        """Determine the most common theme of the given user messages."""
+        # Simple theme extraction based on the first keyword in each message
         themes = []
-        for msg in user_messages[:3]:  # First 3 user messages
-            content = msg.content.lower()
-            if 'machine learning' in content or 'ml' in content:
-                themes.append('machine learning')
-            elif 'artificial intelligence' in content or 'ai' in content:
-                themes.append('artificial intelligence')
-            elif 'data science' in content:
-                themes.append('data science')
-            elif 'programming' in content or 'code' in content:
-                themes.append('programming')
-            elif 'research' in content:
-                themes.append('research')
+        for msg in user_messages:
+            match = THEME_PATTERN.search(msg.content)
+            if match:
+                keyword = match.group(1).lower()
+                themes.append(THEME_ALIASES.get(keyword, keyword))
+        
+        if len(themes) == 1:
+            return themes[0]
         
         if themes:
             # Return the most common theme
-            from collections import Counter
-            theme_counts = Counter(themes)
-            return theme_counts.most_common(1)[0][0]
+            return Counter(themes).most_common(1)[0][0]
         
         return "General conversation"
 
@@ -6,17 +6,40 @@ Handles conversation state, context, and chat-level interactions.
 import uuid
 import json
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func, select, bindparam
 from ..shared.interfaces import IConversationManager
 from ..shared.models import Conversation, ChatMessage, ConversationDB, ChatMessageDB
 from ..shared.exceptions import ConversationError
 
+try:
+    import orjson
+except ImportError:
+    # Optional accelerator; the stdlib json module is used without it
+    orjson = None
+
 
 MAX_STORED_HIGHLIGHTS = 10
 
+# Conversation metadata key pointing at the latest assistant message with a research result
+LAST_RESEARCH_MESSAGE_KEY = "last_research_message_id"
+
+# Maximum number of conversations whose decoded messages are cached
+CONVERSATION_CACHE_SIZE = 128
+
+# Decoded messages per conversation ID, tagged with the updated_at they were read at;
+# every write to a conversation bumps updated_at, which invalidates the entry
+_conversation_cache: "OrderedDict[str, Tuple[datetime, Tuple[ChatMessage, ...]]]" = OrderedDict()
+_conversation_cache_lock = threading.Lock()
+
+# Access-checked conversation lookups, built once instead of as a new ORM query per call
+_CONVERSATION_BY_ID = select(ConversationDB).where(ConversationDB.id == bindparam("conversation_id"))
+_USER_CONVERSATION_BY_ID = _CONVERSATION_BY_ID.where(ConversationDB.user_id == bindparam("user_id"))
+
 
 class ConversationManager(IConversationManager):
     """Manages chat conversations and state using PostgreSQL."""
@@ -34,6 +57,9 @@ class ConversationManager(IConversationManager):
         self.current_user_id = current_user_id
         self.is_admin = is_admin
         self.active_conversation_id: Optional[str] = None
+        
+        # The access filter only depends on the user, so build it once per manager
+        self._access_filter = self._get_user_filter()
     
     def _get_user_filter(self):
         """Get the user filter for queries (admin can see all)."""
@@ -49,17 +75,19 @@ class ConversationManager(IConversationManager):
         if not self.current_user_id:
             raise ConversationError("User must be authenticated to create conversations")
         
+        # The ID is generated here, so the new row never has to be read back
+        conversation_id = str(uuid.uuid4())
         conversation_db = ConversationDB(
+            id=conversation_id,
             user_id=self.current_user_id,
             title=title,
-            conversation_metadata=json.dumps({})
+            conversation_metadata=self._dump_metadata({})
         )
         self.db.add(conversation_db)
         self.db.commit()
-        self.db.refresh(conversation_db)
         
-        self.active_conversation_id = str(conversation_db.id)
-        return str(conversation_db.id)
+        self.active_conversation_id = conversation_id
+        return conversation_id
     
     def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
         """Get a conversation by ID."""
@@ -68,6 +96,10 @@ class ConversationManager(IConversationManager):
             return None
         return self._db_to_conversation(conversation_db)
     
+    def conversation_exists(self, conversation_id: str) -> bool:
+        """Check that a conversation exists and is visible to the current user, without loading its messages."""
+        return self._get_conversation_db(conversation_id) is not None
+    
     def get_active_conversation(self) -> Optional[Conversation]:
         """Get the currently active conversation."""
         if self.active_conversation_id:
@@ -76,86 +108,125 @@ class ConversationManager(IConversationManager):
     
     def set_active_conversation(self, conversation_id: str) -> bool:
         """Set the active conversation."""
-        conversation = self.get_conversation(conversation_id)
-        if conversation:
+        if self.conversation_exists(conversation_id):
             self.active_conversation_id = conversation_id
             return True
         return False
     
     def add_message(self, conversation_id: str, role: str, content: str, 
-                   metadata: Optional[Dict[str, Any]] = None) -> Optional[ChatMessage]:
-        """Add a message to a conversation."""
-        try:
-            conv_uuid = uuid.UUID(conversation_id)
-        except ValueError:
-            return None
-        
-        # Verify conversation exists and user has access
-        conversation = self.get_conversation(conversation_id)
-        if not conversation:
+                   metadata: Optional[Dict[str, Any]] = None,
+                   title: Optional[str] = None) -> Optional[ChatMessage]:
+        """Add a message to a conversation, optionally renaming it in the same commit."""
+        # Verify conversation exists and user has access; the row is reused below and
+        # locked when its metadata will be rewritten, so concurrent writers don't lose updates
+        updates_metadata = bool(metadata and "research_result" in metadata)
+        conversation_db = self._get_conversation_db(conversation_id, for_update=updates_metadata)
+        if not conversation_db:
             return None
         
         # Create message in database
+        created_at = datetime.now(timezone.utc)
         message_db = ChatMessageDB(
-            conversation_id=str(conv_uuid),
+            id=str(uuid.uuid4()),
+            conversation_id=str(conversation_db.id),
             role=role,
             content=content,
-            message_metadata=json.dumps(metadata or {})
+            created_at=created_at,
+            message_metadata=self._dump_metadata(metadata or {})
         )
         self.db.add(message_db)
         
         # Update conversation timestamp
-        conversation_db = self.db.query(ConversationDB).filter(ConversationDB.id == str(conv_uuid)).first()
-        if conversation_db:
-            conversation_db.updated_at = datetime.now(timezone.utc)
+        conversation_db.updated_at = created_at
+        if title:
+            conversation_db.title = title
+        
+        # Remember the latest research message so follow-ups don't scan history
+        if updates_metadata:
+            conversation_metadata = self._parse_metadata(conversation_db.conversation_metadata)
+            conversation_metadata[LAST_RESEARCH_MESSAGE_KEY] = message_db.id
+            conversation_db.conversation_metadata = self._dump_metadata(conversation_metadata)
+        
+        message = ChatMessage(
+            id=message_db.id,
+            role=role,
+            content=content,
+            # The DateTime column stores naive UTC, so match what a reload would return
+            timestamp=created_at.replace(tzinfo=None),
+            metadata=self._parse_metadata(message_db.message_metadata)
+        )
         
+        # Everything returned is known locally, so no refresh round-trip after the commit
         self.db.commit()
-        self.db.refresh(message_db)
         
-        return self._db_to_message(message_db)
+        return message
     
     def get_conversation_history(self, conversation_id: str, max_messages: int = 50) -> List[ChatMessage]:
         """Get conversation history."""
-        try:
-            conv_uuid = uuid.UUID(conversation_id)
-        except ValueError:
-            return []
-        
         # Verify access
-        conversation = self.get_conversation(conversation_id)
-        if not conversation:
+        conversation_db = self._get_conversation_db(conversation_id)
+        if not conversation_db:
             return []
         
+        # Serve from the decoded messages when the conversation is unchanged
+        messages = self._get_cached_messages(conversation_db)
+        if messages is not None:
+            return list(messages[-max_messages:]) if max_messages > 0 else []
+        
         # Get messages from database
         messages_db = self.db.query(ChatMessageDB).filter(
-            ChatMessageDB.conversation_id == conversation_id
+            ChatMessageDB.conversation_id == conversation_db.id
         ).order_by(ChatMessageDB.created_at.desc()).limit(max_messages).all()
         
         return [self._db_to_message(msg) for msg in reversed(messages_db)]
     
-    def list_conversations(self) -> List[Dict[str, Any]]:
-        """List all conversations with basic info."""
-        query = self.db.query(ConversationDB)
+    def list_conversations(self, limit: Optional[int] = None,
+                           before: Optional[Tuple[datetime, str]] = None) -> List[Dict[str, Any]]:
+        """
+        List conversations with basic info, most recently updated first.
         
-        # Apply user filter
-        if not self.is_admin and self.current_user_id:
-            query = query.filter(ConversationDB.user_id == self.current_user_id)
-        elif not self.is_admin:
+        Args:
+            limit: Maximum number of conversations to return (all if None)
+            before: Keyset cursor of (updated_at, id) from the last conversation of
+                the previous page; only conversations after it are returned
+            
+        Returns:
+            List of conversation info dictionaries
+        """
+        if self._access_filter is False:
             return []  # No user, no conversations
         
+        # Count messages in the same statement instead of one query per conversation
+        message_count = self.db.query(func.count(ChatMessageDB.id)).filter(
+            ChatMessageDB.conversation_id == ConversationDB.id
+        ).correlate(ConversationDB).scalar_subquery()
+        
+        query = self.db.query(ConversationDB, message_count)
+        
+        # Apply user filter
+        if self._access_filter is not True:
+            query = query.filter(self._access_filter)
+        
         # Filter out system conversations for document uploads
         query = query.filter(
             ~ConversationDB.conversation_metadata.like('%"source": "document_upload"%')
         )
         
-        conversations_db = query.order_by(ConversationDB.updated_at.desc()).all()
+        if before is not None:
+            before_updated_at, before_id = before
+            query = query.filter(or_(
+                ConversationDB.updated_at < before_updated_at,
+                and_(ConversationDB.updated_at == before_updated_at, ConversationDB.id < before_id)
+            ))
+        
+        query = query.order_by(ConversationDB.updated_at.desc(), ConversationDB.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        
+        conversations_db = query.all()
         
         conversations = []
-        for conv_db in conversations_db:
-            message_count = self.db.query(ChatMessageDB).filter(
-                ChatMessageDB.conversation_id == conv_db.id
-            ).count()
-            
+        for conv_db, message_count in conversations_db:
             conversations.append({
                 'id': str(conv_db.id),
                 'title': conv_db.title,
@@ -169,47 +240,35 @@ class ConversationManager(IConversationManager):
     
     def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation."""
-        try:
-            conv_uuid = uuid.UUID(conversation_id)
-        except ValueError:
-            return False
-        
         # Verify access
-        conversation = self.get_conversation(conversation_id)
-        if not conversation:
+        conversation_db = self._get_conversation_db(conversation_id)
+        if not conversation_db:
             return False
         
         # Delete from database (cascade will handle messages)
-        conversation_db = self.db.query(ConversationDB).filter(ConversationDB.id == conversation_id).first()
-        if conversation_db:
-            self.db.delete(conversation_db)
-            self.db.commit()
-            
-            if self.active_conversation_id == conversation_id:
-                self.active_conversation_id = None
-            return True
-        return False
+        stored_id = str(conversation_db.id)
+        self.db.delete(conversation_db)
+        self.db.commit()
+        
+        with _conversation_cache_lock:
+            _conversation_cache.pop(stored_id, None)
+        
+        if self.active_conversation_id in (conversation_id, stored_id):
+            self.active_conversation_id = None
+        return True
     
     def update_conversation_title(self, conversation_id: str, title: str) -> bool:
         """Update conversation title."""
-        try:
-            conv_uuid = uuid.UUID(conversation_id)
-        except ValueError:
-            return False
-        
         # Verify access
-        conversation = self.get_conversation(conversation_id)
-        if not conversation:
+        conversation_db = self._get_conversation_db(conversation_id)
+        if not conversation_db:
             return False
         
         # Update in database
-        conversation_db = self.db.query(ConversationDB).filter(ConversationDB.id == conversation_id).first()
-        if conversation_db:
-            conversation_db.title = title
-            conversation_db.updated_at = datetime.now(timezone.utc)
-            self.db.commit()
-            return True
-        return False
+        conversation_db.title = title
+        conversation_db.updated_at = datetime.now(timezone.utc)
+        self.db.commit()
+        return True
     
     def get_conversation_context(self, conversation_id: str) -> Dict[str, Any]:
         """Get conversation context for research agent."""
@@ -217,17 +276,42 @@ class ConversationManager(IConversationManager):
         if not conversation:
             return {}
         
-        # Build context from recent messages
-        recent_messages = self.get_conversation_history(conversation_id, 10)
+        # Build context from recent messages of the already loaded conversation
+        recent_messages = conversation.messages[-10:]
         context = {
             'conversation_id': conversation_id,
             'recent_messages': [msg.to_dict() for msg in recent_messages],
-            'conversation_summary': self.get_conversation_summary(conversation_id),
+            'conversation_summary': conversation.get_conversation_summary(),
             'message_count': len(recent_messages)
         }
         
         return context
     
+    def get_last_research_message(self, conversation_id: str) -> Optional[ChatMessage]:
+        """Get the most recent assistant message that carries a research result."""
+        conversation_db = self._get_conversation_db(conversation_id)
+        if not conversation_db:
+            return None
+        
+        metadata = self._parse_metadata(conversation_db.conversation_metadata)
+        message_id = metadata.get(LAST_RESEARCH_MESSAGE_KEY)
+        
+        query = self.db.query(ChatMessageDB).filter(ChatMessageDB.conversation_id == conversation_db.id)
+        if message_id:
+            message_db = query.filter(ChatMessageDB.id == message_id).first()
+        else:
+            # Conversations stored before the pointer existed
+            message_db = query.filter(
+                ChatMessageDB.role == "assistant",
+                ChatMessageDB.message_metadata.like('%"research_result"%')
+            ).order_by(ChatMessageDB.created_at.desc()).first()
+        
+        if not message_db:
+            return None
+        
+        message = self._db_to_message(message_db)
+        return message if "research_result" in message.metadata else None
+    
     def get_conversation_summary(self, conversation_id: str) -> str:
         """Get a summary of the conversation."""
         conversation = self.get_conversation(conversation_id)
@@ -238,16 +322,11 @@ class ConversationManager(IConversationManager):
 
     def add_highlight(self, conversation_id: str, highlight: str) -> Optional[List[str]]:
         """Append a highlight to the conversation metadata and return stored highlights."""
-        conversation_db = self._get_conversation_db(conversation_id)
+        conversation_db = self._get_conversation_db(conversation_id, for_update=True)
         if not conversation_db:
             return None
 
-        metadata: Dict[str, Any] = {}
-        if conversation_db.conversation_metadata:
-            try:
-                metadata = json.loads(conversation_db.conversation_metadata)
-            except (json.JSONDecodeError, TypeError):
-                metadata = {}
+        metadata = self._parse_metadata(conversation_db.conversation_metadata)
 
         highlights = metadata.get("highlights", [])
         if not isinstance(highlights, list):
@@ -258,7 +337,7 @@ class ConversationManager(IConversationManager):
             highlights = highlights[-MAX_STORED_HIGHLIGHTS:]
 
         metadata["highlights"] = highlights
-        conversation_db.conversation_metadata = json.dumps(metadata)
+        conversation_db.conversation_metadata = self._dump_metadata(metadata)
         conversation_db.updated_at = datetime.now(timezone.utc)
 
         self.db.commit()
@@ -268,20 +347,10 @@ class ConversationManager(IConversationManager):
     
     def _db_to_conversation(self, conv_db: ConversationDB) -> Conversation:
         """Convert ConversationDB to Conversation dataclass."""
-        # Get messages for this conversation
-        messages_db = self.db.query(ChatMessageDB).filter(
-            ChatMessageDB.conversation_id == conv_db.id
-        ).order_by(ChatMessageDB.created_at).all()
-        
-        messages = [self._db_to_message(msg) for msg in messages_db]
+        messages = list(self._get_messages(conv_db))
         
         # Parse metadata from JSON string
-        metadata = {}
-        if conv_db.conversation_metadata:
-            try:
-                metadata = json.loads(conv_db.conversation_metadata)
-            except (json.JSONDecodeError, TypeError):
-                metadata = {}
+        metadata = self._parse_metadata(conv_db.conversation_metadata)
         
         return Conversation(
             id=str(conv_db.id),
@@ -293,15 +362,40 @@ class ConversationManager(IConversationManager):
             is_active=conv_db.is_active
         )
     
+    def _get_cached_messages(self, conv_db: ConversationDB) -> Optional[Tuple[ChatMessage, ...]]:
+        """Get the cached messages of a conversation if they match its current updated_at."""
+        conversation_id = str(conv_db.id)
+        with _conversation_cache_lock:
+            cached = _conversation_cache.get(conversation_id)
+            if cached is None or cached[0] != conv_db.updated_at:
+                return None
+            _conversation_cache.move_to_end(conversation_id)
+            return cached[1]
+    
+    def _get_messages(self, conv_db: ConversationDB) -> Tuple[ChatMessage, ...]:
+        """Get the decoded messages of a conversation, reusing them while it is unchanged."""
+        messages = self._get_cached_messages(conv_db)
+        if messages is not None:
+            return messages
+        
+        messages_db = self.db.query(ChatMessageDB).filter(
+            ChatMessageDB.conversation_id == conv_db.id
+        ).order_by(ChatMessageDB.created_at).all()
+        messages = tuple(self._db_to_message(msg) for msg in messages_db)
+        
+        conversation_id = str(conv_db.id)
+        with _conversation_cache_lock:
+            _conversation_cache[conversation_id] = (conv_db.updated_at, messages)
+            _conversation_cache.move_to_end(conversation_id)
+            if len(_conversation_cache) > CONVERSATION_CACHE_SIZE:
+                _conversation_cache.popitem(last=False)
+        
+        return messages
+    
     def _db_to_message(self, msg_db: ChatMessageDB) -> ChatMessage:
         """Convert ChatMessageDB to ChatMessage dataclass."""
         # Parse metadata from JSON string
-        metadata = {}
-        if msg_db.message_metadata:
-            try:
-                metadata = json.loads(msg_db.message_metadata)
-            except (json.JSONDecodeError, TypeError):
-                metadata = {}
+        metadata = self._parse_metadata(msg_db.message_metadata)
         
         return ChatMessage(
             id=str(msg_db.id),
@@ -311,21 +405,64 @@ class ConversationManager(IConversationManager):
             metadata=metadata
         )
 
-    def _get_conversation_db(self, conversation_id: str) -> Optional[ConversationDB]:
-        """Internal helper to fetch a conversation DB record with access control."""
+    @staticmethod
+    def _parse_metadata(raw_metadata: Optional[str]) -> Dict[str, Any]:
+        """Parse a JSON metadata column, returning an empty dict if missing or invalid."""
+        if not raw_metadata:
+            return {}
+        metadata = None
+        if orjson is not None:
+            try:
+                metadata = orjson.loads(raw_metadata)
+            except (orjson.JSONDecodeError, TypeError):
+                # Rows written by the stdlib encoder may contain NaN, which orjson rejects
+                pass
+        if metadata is None:
+            try:
+                metadata = json.loads(raw_metadata)
+            except (json.JSONDecodeError, TypeError):
+                return {}
+        return metadata if isinstance(metadata, dict) else {}
+
+    @staticmethod
+    def _dump_metadata(metadata: Dict[str, Any]) -> str:
+        """Serialize metadata for a JSON text column, using orjson when it is installed."""
+        if orjson is not None:
+            try:
+                return orjson.dumps(metadata).decode()
+            except TypeError:
+                # e.g. non-string keys, which the stdlib encoder coerces
+                pass
+        return json.dumps(metadata)
+
+    def _get_conversation_db(self, conversation_id: str, for_update: bool = False) -> Optional[ConversationDB]:
+        """
+        Internal helper to fetch a conversation DB record with access control.
+        
+        Args:
+            conversation_id: ID of the conversation
+            for_update: Lock the row until commit, for read-modify-write of its metadata
+        """
+        if self._access_filter is False:
+            return None
+
         try:
-            uuid.UUID(conversation_id)
+            conversation_uuid = uuid.UUID(conversation_id)
         except ValueError:
             return None
 
-        query = self.db.query(ConversationDB).filter(ConversationDB.id == conversation_id)
+        # IDs are stored in canonical form, so match on that rather than the raw input
+        params = {"conversation_id": str(conversation_uuid)}
+        if self._access_filter is True:
+            statement = _CONVERSATION_BY_ID
+        else:
+            statement = _USER_CONVERSATION_BY_ID
+            params["user_id"] = self.current_user_id
 
-        if not self.is_admin and self.current_user_id:
-            query = query.filter(ConversationDB.user_id == self.current_user_id)
-        elif not self.is_admin:
-            return None
+        if for_update:
+            statement = statement.with_for_update()
 
-        return query.first()
+        return self.db.execute(statement, params).scalars().first()
 
 
 if __name__ == "__main__":
@@ -6,18 +6,43 @@ Handles generating conversational responses from research results.
 from typing import Dict, Any, Optional, List
 from ..shared.models import ResearchResult, ChatMessage
 
+# Question words skipped when picking topic words from a subquery
+FOLLOW_UP_STOPWORDS = frozenset(['what', 'how', 'why', 'when', 'where', 'which'])
+
+# Follow-up rules: the topic words that must all appear, an optional phrase that
+# also triggers the rule when found in a subquery, and the suggestions to offer
+FOLLOW_UP_RULES = (
+    (frozenset(['machine', 'learning']), 'machine learning', (
+        "Can you tell me more about specific machine learning algorithms?",
+        "What are the latest trends in machine learning?",
+        "How is machine learning being used in different industries?"
+    )),
+    (frozenset(['artificial', 'intelligence']), None, (
+        "What are the ethical implications of AI?",
+        "How does AI differ from traditional programming?",
+        "What are the limitations of current AI systems?"
+    )),
+    (frozenset(['data', 'science']), None, (
+        "What tools are commonly used in data science?",
+        "How do you become a data scientist?",
+        "What are the biggest challenges in data science?"
+    )),
+)
+
+# Maximum number of follow-up suggestions returned
+MAX_FOLLOW_UP_SUGGESTIONS = 3
+
 
 class ResponseGenerator:
     """
     Response generator that creates conversational responses from research results.
-    """
     
-    def __init__(self):
-        """Initialize response generator."""
-        pass
+    Holds no state, so every method is static and one instance can be shared.
+    """
     
-    def generate_chat_response(self, research_result: ResearchResult, 
-                             context: Dict[str, Any]) -> str:
+    @staticmethod
+    def generate_chat_response(research_result: ResearchResult, 
+                               context: Dict[str, Any]) -> str:
         """
         Generate a conversational response from research results.
         
@@ -46,7 +71,7 @@ class ResponseGenerator:
         
         # Add source information
         if citations:
-            unique_sources = len(set(citation.get('filename', '') for citation in citations))
+            unique_sources = len({citation.get('filename', '') for citation in citations})
             response_parts.append(f"\n**Sources:** I consulted {len(citations)} relevant documents from {unique_sources} different sources.")
         
         # Add follow-up suggestion
@@ -54,7 +79,8 @@ class ResponseGenerator:
         
         return '\n'.join(response_parts)
     
-    def generate_error_response(self, error: str, context: Dict[str, Any]) -> str:
+    @staticmethod
+    def generate_error_response(error: str, context: Dict[str, Any]) -> str:
         """
         Generate an error response.
         
@@ -73,7 +99,8 @@ class ResponseGenerator:
         
         return '\n'.join(response_parts)
     
-    def generate_greeting_response(self, context: Dict[str, Any]) -> str:
+    @staticmethod
+    def generate_greeting_response(context: Dict[str, Any]) -> str:
         """
         Generate a greeting response for new conversations.
         
@@ -86,7 +113,8 @@ class ResponseGenerator:
         return ("Hello! I'm your research assistant. I can help you explore complex topics by breaking them down into focused research areas and finding relevant information from our document collection.\n\n"
                 "What would you like to research today?")
     
-    def generate_follow_up_suggestions(self, research_result: ResearchResult) -> List[str]:
+    @staticmethod
+    def generate_follow_up_suggestions(research_result: ResearchResult) -> List[str]:
         """
         Generate follow-up question suggestions based on research results.
         
@@ -99,38 +127,26 @@ class ResponseGenerator:
         suggestions = []
         
         # Extract topics from subqueries
-        topics = []
+        topics = set()
         topic_phrases = []
         for sq in research_result.subqueries:
             if sq.success and sq.summary:
                 # Extract key terms from subquery
-                words = sq.subquery.lower().split()
-                key_words = [w for w in words if len(w) > 3 and w not in ['what', 'how', 'why', 'when', 'where', 'which']]
-                topics.extend(key_words[:2])  # Top 2 words per subquery
+                phrase = sq.subquery.lower()
+                key_words = [w for w in phrase.split() if len(w) > 3 and w not in FOLLOW_UP_STOPWORDS]
+                topics.update(key_words[:2])  # Top 2 words per subquery
                 # Also check for common phrases
-                topic_phrases.append(sq.subquery.lower())
-        
-        # Generate suggestions based on topics
-        if 'machine' in topics and 'learning' in topics or any('machine learning' in phrase for phrase in topic_phrases):
-            suggestions.extend([
-                "Can you tell me more about specific machine learning algorithms?",
-                "What are the latest trends in machine learning?",
-                "How is machine learning being used in different industries?"
-            ])
-        
-        if 'artificial' in topics and 'intelligence' in topics:
-            suggestions.extend([
-                "What are the ethical implications of AI?",
-                "How does AI differ from traditional programming?",
-                "What are the limitations of current AI systems?"
-            ])
-        
-        if 'data' in topics and 'science' in topics:
-            suggestions.extend([
-                "What tools are commonly used in data science?",
-                "How do you become a data scientist?",
-                "What are the biggest challenges in data science?"
-            ])
+                topic_phrases.append(phrase)
+        
+        # Newline-joined so a phrase cannot match across two subqueries
+        topic_text = '\n'.join(topic_phrases)
+        
+        # Generate suggestions based on topics, stopping once enough are collected
+        for words, phrase, rule_suggestions in FOLLOW_UP_RULES:
+            if len(suggestions) >= MAX_FOLLOW_UP_SUGGESTIONS:
+                break
+            if topics.issuperset(words) or (phrase and phrase in topic_text):
+                suggestions.extend(rule_suggestions)
         
         # Generic suggestions if no specific topics found
         if not suggestions:
@@ -140,9 +156,10 @@ class ResponseGenerator:
                 "Are there any recent developments in this area?"
             ]
         
-        return suggestions[:3]  # Return top 3 suggestions
+        return suggestions[:MAX_FOLLOW_UP_SUGGESTIONS]
     
-    def format_citations(self, citations: List[Dict[str, Any]], max_citations: int = 5) -> str:
+    @staticmethod
+    def format_citations(citations: List[Dict[str, Any]], max_citations: int = 5) -> str:
         """
         Format citations for display.
         
@@ -156,19 +173,19 @@ class ResponseGenerator:
         if not citations:
             return ""
         
-        citation_text = "\n**Sources consulted:**\n"
+        citation_parts = ["\n**Sources consulted:**\n"]
         
         for i, citation in enumerate(citations[:max_citations], 1):
             title = citation.get('title', 'Unknown')
             filename = citation.get('filename', 'Unknown')
             score = citation.get('score', 0)
             
-            citation_text += f"{i}. {title} ({filename}) - Relevance: {score:.2f}\n"
+            citation_parts.append(f"{i}. {title} ({filename}) - Relevance: {score:.2f}\n")
         
         if len(citations) > max_citations:
-            citation_text += f"... and {len(citations) - max_citations} more sources\n"
+            citation_parts.append(f"... and {len(citations) - max_citations} more sources\n")
         
-        return citation_text
+        return ''.join(citation_parts)
 
 
 if __name__ == "__main__":
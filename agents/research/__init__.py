@@ -7,10 +7,12 @@ from .research_agent import ResearchAgent
 from .query_planner import QueryPlanner
 from .document_retriever import DocumentRetriever
 from .answer_synthesizer import AnswerSynthesizer
+from .semantic_cache import SemanticCache
 
 __all__ = [
     'ResearchAgent',
     'QueryPlanner', 
     'DocumentRetriever',
-    'AnswerSynthesizer'
+    'AnswerSynthesizer',
+    'SemanticCache'
 ]
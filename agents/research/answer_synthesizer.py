@@ -3,12 +3,49 @@ Answer Synthesizer for Multi-hop Research Agent
 Handles answer synthesis from subquery results.
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, FrozenSet, Iterator, Optional, Tuple
+from collections import OrderedDict
+from operator import itemgetter
+import heapq
 import re
 from ..shared.interfaces import IAnswerSynthesizer, ILLMClient
 from ..shared.models import SubqueryResult
 
 
+# Maximum number of subqueries summarized in one batched LLM prompt
+MAX_BATCH_SUMMARIES = 8
+
+# Answer returned when no subquery produced usable findings
+NO_FINDINGS_ANSWER = "I apologize, but I encountered errors while researching your question and couldn't retrieve relevant information. Please try rephrasing your question or check if the knowledge base is accessible."
+
+# Summary used for subqueries without relevant documents
+NO_RELEVANT_INFORMATION = "No relevant information found for this aspect."
+
+# Sentences for the rule-based summarizer: runs between . ! ? with surrounding
+# whitespace excluded, longer than 10 characters, matched in a single scan
+SENTENCE_PATTERN = re.compile(r'[^.!?\s][^.!?]{9,}[^.!?\s]')
+
+# Maximum number of document texts whose tokenized sentences are memoized
+SENTENCE_TOKEN_CACHE_SIZE = 256
+
+# System prompt for synthesizing the final answer from subquery findings
+SYNTHESIS_SYSTEM_PROMPT = (
+    "You are a research assistant that synthesizes information from multiple sources.\n"
+    "Create a comprehensive, well-structured answer that addresses the main question.\n"
+    "Use information from all the research areas provided.\n"
+    "Structure your answer clearly and provide a coherent narrative.\n"
+    "Be thorough but concise."
+)
+
+# System prompt for summarizing a subquery's documents
+SUMMARY_SYSTEM_PROMPT = (
+    "You are a research assistant that summarizes documents to answer specific questions.\n"
+    "Focus on information that directly relates to the question being asked.\n"
+    "Synthesize information from multiple documents into a coherent summary.\n"
+    "Be concise but comprehensive. Use information from the documents provided."
+)
+
+
 class AnswerSynthesizer(IAnswerSynthesizer):
     """
     Answer synthesizer that combines subquery results into a final answer.
@@ -23,6 +60,12 @@ class AnswerSynthesizer(IAnswerSynthesizer):
         """
         self.llm_client = llm_client
         self.use_llm = llm_client is not None and llm_client.is_available()
+        
+        # Track how often batched summarization has to fall back to per-subquery calls
+        self.batch_stats = {'batched': 0, 'fallbacks': 0}
+        
+        # Tokenized sentences per document text, reused when documents repeat across subqueries
+        self._sentence_tokens: "OrderedDict[str, List[Tuple[str, FrozenSet[str]]]]" = OrderedDict()
     
     def synthesize_answer(self, question: str, subquery_results: List[Dict[str, Any]]) -> str:
         """
@@ -40,52 +83,84 @@ class AnswerSynthesizer(IAnswerSynthesizer):
         else:
             return self._synthesize_rule_based(question, subquery_results)
     
+    def synthesize_answer_stream(self, question: str, subquery_results: List[Dict[str, Any]]) -> Iterator[str]:
+        """
+        Synthesize final answer from subquery results, yielding text as it is generated.
+        
+        Falls back to yielding the complete answer at once when the LLM client
+        does not support streaming.
+        
+        Args:
+            question: Original research question
+            subquery_results: Results from each subquery
+            
+        Yields:
+            Fragments of the final answer
+        """
+        stream_text = getattr(self.llm_client, 'generate_text_stream', None)
+        if not self.use_llm or not callable(stream_text):
+            yield self.synthesize_answer(question, subquery_results)
+            return
+        
+        prompts = self._build_synthesis_prompts(question, subquery_results)
+        if prompts is None:
+            yield NO_FINDINGS_ANSWER
+            return
+        
+        prompt, system_prompt = prompts
+        yield from stream_text(prompt, system_prompt, max_tokens=1500)
+    
     def _synthesize_with_llm(self, question: str, subquery_results: List[Dict[str, Any]]) -> str:
         """Synthesize answer using LLM."""
+        prompts = self._build_synthesis_prompts(question, subquery_results)
+        if prompts is None:
+            return NO_FINDINGS_ANSWER
+        
+        prompt, system_prompt = prompts
+        return self.llm_client.generate_text(prompt, system_prompt, max_tokens=1500)
+    
+    def _build_synthesis_prompts(self, question: str,
+                                 subquery_results: List[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+        """Build the (prompt, system_prompt) pair for LLM synthesis, or None without findings."""
         # Prepare subquery summaries
         subquery_texts = []
         for i, result in enumerate(subquery_results, 1):
-            if hasattr(result, 'summary') and result.summary and result.summary != "No relevant information found for this aspect.":
+            if hasattr(result, 'summary') and result.summary and result.summary != NO_RELEVANT_INFORMATION:
                 subquery_texts.append(f"Research Area {i}: {result.subquery}\n{result.summary}")
         
         # Check if we have any successful research findings
         if not subquery_texts:
-            return "I apologize, but I encountered errors while researching your question and couldn't retrieve relevant information. Please try rephrasing your question or check if the knowledge base is accessible."
-        
-        system_prompt = """You are a research assistant that synthesizes information from multiple sources.
-        Create a comprehensive, well-structured answer that addresses the main question.
-        Use information from all the research areas provided.
-        Structure your answer clearly and provide a coherent narrative.
-        Be thorough but concise."""
+            return None
         
+        findings = "\n".join(subquery_texts)
         prompt = f"""Main Question: {question}
 
 Research Findings:
-{chr(10).join(subquery_texts)}
+{findings}
 
 Provide a comprehensive answer that synthesizes all the research findings:"""
         
-        return self.llm_client.generate_text(prompt, system_prompt, max_tokens=1500)
+        return prompt, SYNTHESIS_SYSTEM_PROMPT
     
     def _synthesize_rule_based(self, question: str, subquery_results: List[Dict[str, Any]]) -> str:
         """Synthesize answer using rule-based approach."""
         if not subquery_results:
             return "I couldn't find enough information to answer your question."
         
-        # Collect all summaries
-        summaries = [result.summary for result in subquery_results if hasattr(result, 'summary') and result.summary]
-        
-        if not summaries:
-            return "I found some relevant documents but couldn't extract meaningful information."
-        
-        # Create synthesis
+        # Create synthesis in a single pass over the results
         synthesis_parts = [
             f"Based on my research, here's what I found about '{question}':\n\n"
         ]
+        found = False
         
         for i, result in enumerate(subquery_results, 1):
-            if hasattr(result, 'summary') and result.summary and result.summary != "No relevant information found for this aspect.":
-                synthesis_parts.append(f"{i}. {result.summary}\n")
+            summary = getattr(result, 'summary', None)
+            if summary and summary != NO_RELEVANT_INFORMATION:
+                synthesis_parts.append(f"{i}. {summary}\n")
+                found = True
+        
+        if not found:
+            return "I found some relevant documents but couldn't extract meaningful information."
         
         synthesis_parts.append("\nThis information is synthesized from multiple sources to provide a comprehensive answer.")
         
@@ -103,13 +178,54 @@ Provide a comprehensive answer that synthesizes all the research findings:"""
             Summarized text
         """
         if not documents:
-            return "No relevant information found for this aspect."
+            return NO_RELEVANT_INFORMATION
         
         if self.use_llm:
             return self._summarize_with_llm(documents, subquery)
         else:
             return self._summarize_rule_based(documents, subquery)
     
+    def summarize_documents_batch(self, documents_per_subquery: List[List[Dict[str, Any]]],
+                                  subqueries: List[str]) -> List[str]:
+        """
+        Summarize retrieved documents for several subqueries at once.
+        
+        With an LLM client that supports batching, subqueries are summarized in
+        groups of up to MAX_BATCH_SUMMARIES per call. Summaries missing from the
+        batched output fall back to individual calls.
+        
+        Args:
+            documents_per_subquery: Retrieved documents for each subquery
+            subqueries: The subqueries being addressed
+            
+        Returns:
+            List of summaries in the same order as subqueries
+        """
+        batch_summarize = getattr(self.llm_client, 'summarize_batch', None)
+        if not self.use_llm or not callable(batch_summarize):
+            return [self.summarize_documents(documents, subquery)
+                    for documents, subquery in zip(documents_per_subquery, subqueries)]
+        
+        summaries = []
+        for start in range(0, len(subqueries), MAX_BATCH_SUMMARIES):
+            batch_subqueries = subqueries[start:start + MAX_BATCH_SUMMARIES]
+            batch_documents = documents_per_subquery[start:start + MAX_BATCH_SUMMARIES]
+            
+            batched = batch_summarize(batch_subqueries, batch_documents)
+            if not isinstance(batched, dict):
+                batched = {}
+            
+            for index, (documents, subquery) in enumerate(zip(batch_documents, batch_subqueries)):
+                summary = batched.get(str(index))
+                if isinstance(summary, str) and summary:
+                    self.batch_stats['batched'] += 1
+                    summaries.append(summary)
+                else:
+                    self.batch_stats['fallbacks'] += 1
+                    summaries.append(self.summarize_documents(documents, subquery))
+        
+        return summaries
+    
     def _summarize_with_llm(self, documents: List[Dict[str, Any]], subquery: str) -> str:
         """Summarize documents using LLM."""
         # Prepare document content
@@ -117,31 +233,27 @@ Provide a comprehensive answer that synthesizes all the research findings:"""
         for i, doc in enumerate(documents, 1):
             doc_texts.append(f"Document {i}: {doc.get('title', 'Unknown')}\n{doc.get('full_text', '')[:1000]}...")
         
-        system_prompt = """You are a research assistant that summarizes documents to answer specific questions.
-        Focus on information that directly relates to the question being asked.
-        Synthesize information from multiple documents into a coherent summary.
-        Be concise but comprehensive. Use information from the documents provided."""
-        
+        documents_text = "\n".join(doc_texts)
         prompt = f"""Question: {subquery}
 
 Documents to summarize:
-{chr(10).join(doc_texts)}
+{documents_text}
 
 Provide a focused summary that answers the question:"""
         
-        return self.llm_client.generate_text(prompt, system_prompt, max_tokens=800)
+        return self.llm_client.generate_text(prompt, SUMMARY_SYSTEM_PROMPT, max_tokens=800)
     
     def _summarize_rule_based(self, documents: List[Dict[str, Any]], subquery: str) -> str:
         """Summarize documents using rule-based approach."""
         # Extract key sentences from each document
         key_sentences = []
+        query_words = set(subquery.lower().split())
         
         for doc in documents:
             text = doc.get('full_text', '')
             if text:
-                # Split into sentences and pick the most relevant ones
-                sentences = self._split_into_sentences(text)
-                relevant_sentences = self._select_relevant_sentences(sentences, subquery)
+                # Pick the most relevant of the document's tokenized sentences
+                relevant_sentences = self._rank_sentences(self._tokenize_sentences(text), query_words)
                 key_sentences.extend(relevant_sentences[:2])  # Top 2 sentences per doc
         
         # Remove duplicates and join
@@ -151,29 +263,36 @@ Provide a focused summary that answers the question:"""
         return summary if summary else "Relevant information found but could not be summarized."
     
     def _split_into_sentences(self, text: str) -> List[str]:
-        """Split text into sentences."""
-        sentences = re.split(r'[.!?]+', text)
-        sentences = [s.strip() for s in sentences if s.strip() and len(s.strip()) > 10]
-        return sentences
+        """Split text into stripped sentences longer than 10 characters."""
+        return SENTENCE_PATTERN.findall(text)
+    
+    def _tokenize_sentences(self, text: str) -> List[Tuple[str, FrozenSet[str]]]:
+        """Split text into sentences paired with their lowercased word sets, memoized per text."""
+        tokenized = self._sentence_tokens.get(text)
+        if tokenized is not None:
+            self._sentence_tokens.move_to_end(text)
+            return tokenized
+        
+        tokenized = [(sentence, frozenset(sentence.lower().split()))
+                     for sentence in self._split_into_sentences(text)]
+        self._sentence_tokens[text] = tokenized
+        if len(self._sentence_tokens) > SENTENCE_TOKEN_CACHE_SIZE:
+            self._sentence_tokens.popitem(last=False)
+        return tokenized
     
-    def _select_relevant_sentences(self, sentences: List[str], query: str) -> List[str]:
+    def _select_relevant_sentences(self, sentences: List[str], query: str, top_k: int = 2) -> List[str]:
         """Select the most relevant sentences for a query."""
-        if not sentences:
-            return []
-        
-        query_words = set(query.lower().split())
-        scored_sentences = []
-        
-        for sentence in sentences:
-            sentence_words = set(sentence.lower().split())
-            # Simple scoring based on word overlap
-            overlap = len(query_words.intersection(sentence_words))
-            if overlap > 0:
-                scored_sentences.append((overlap, sentence))
-        
-        # Sort by relevance score and return top sentences
-        scored_sentences.sort(key=lambda x: x[0], reverse=True)
-        return [sentence for _, sentence in scored_sentences[:2]]
+        tokenized = [(sentence, frozenset(sentence.lower().split())) for sentence in sentences]
+        return self._rank_sentences(tokenized, set(query.lower().split()), top_k)
+    
+    def _rank_sentences(self, tokenized: List[Tuple[str, FrozenSet[str]]],
+                        query_words: set, top_k: int = 2) -> List[str]:
+        """Rank tokenized sentences by word overlap with the query."""
+        scored = ((len(query_words & words), sentence) for sentence, words in tokenized)
+        
+        # Partial selection of the best scores; ties keep their original order
+        best = heapq.nlargest(top_k, (item for item in scored if item[0] > 0), key=itemgetter(0))
+        return [sentence for _, sentence in best]
 
 
 if __name__ == "__main__":
@@ -3,14 +3,21 @@ Document Retriever for Multi-hop Research Agent
 Handles document retrieval from Postgres + pgvector database.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
+import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, select
 from sentence_transformers import SentenceTransformer
 from ..shared.interfaces import IRetriever
 from ..shared.exceptions import RetrievalError
-from embedding_storage import retrieve_similar_embeddings
+from embedding_storage import retrieve_similar_embeddings, EMBEDDING_DIM
 from agents.shared.models import EmbeddingDB
+from .embedding_cache import get_embedding_provider
+
+logger = logging.getLogger(__name__)
+
+# Characters of document text kept in a result snippet
+SNIPPET_LENGTH = 200
 
 
 class DocumentRetriever(IRetriever):
@@ -30,7 +37,20 @@ class DocumentRetriever(IRetriever):
         self.db_session = db_session
         self.model = model
         self.user_id = user_id
-        print(f"Document retriever initialized for user {user_id}")
+        self.embedding_provider = get_embedding_provider(model)
+        logger.debug("Document retriever initialized for user %s", user_id)
+    
+    def embed_query(self, query: str):
+        """
+        Get the normalized embedding for a query.
+        
+        Args:
+            query: Query text
+            
+        Returns:
+            Embedding vector as a NumPy array
+        """
+        return self.embedding_provider.encode(query)
     
     def retrieve(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """
@@ -46,47 +66,81 @@ class DocumentRetriever(IRetriever):
         Raises:
             RetrievalError: If retrieval fails
         """
+        return self.retrieve_many([query], top_k)[0]
+    
+    def retrieve_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve top-k most relevant documents for several queries.
+        
+        All queries are embedded in a single batched forward pass before
+        their similarity searches run; repeated queries are searched once.
+        
+        Args:
+            queries: Search queries
+            top_k: Number of results to return per query
+            
+        Returns:
+            List of result lists in the same order as queries
+            
+        Raises:
+            RetrievalError: If retrieval fails
+        """
+        if not queries:
+            return []
+        
         try:
-            # Generate query embedding
-            query_embedding = self.model.encode([query], normalize_embeddings=True)[0]
-            
-            # Query Postgres for similar embeddings
-            embedding_results = retrieve_similar_embeddings(
-                db_session=self.db_session,
-                user_id=self.user_id,
-                query_vector=query_embedding.tolist(),
-                k=top_k
-            )
-            
-            # Format results
-            formatted_results = []
-            for result in embedding_results:
-                metadata = result.get('metadata', {})
-                
-                # Extract text content from metadata
-                text_content = metadata.get('text', '')
-                if not text_content:
-                    continue
-                
-                # Create snippet (first 200 chars)
-                snippet = text_content[:200] + "..." if len(text_content) > 200 else text_content
-                
-                formatted_results.append({
-                    'doc_id': result['id'],
-                    'title': metadata.get('title', 'Unknown'),
-                    'snippet': snippet,
-                    'score': result['similarity_score'],
-                    'filename': metadata.get('filename', 'Unknown'),
-                    'full_text': text_content,
-                    'message_id': result['message_id'],
-                    'chunk_index': metadata.get('chunk_index', 0)
-                })
-            
-            return formatted_results
+            # Generate query embeddings (cached across retrievers sharing the model)
+            embeddings = self.embedding_provider.encode_many(queries)
+            
+            searched: Dict[str, List[Dict[str, Any]]] = {}
+            results = []
+            for query, query_embedding in zip(queries, embeddings):
+                key = " ".join(query.split())
+                if key not in searched:
+                    searched[key] = self._search(query_embedding, top_k)
+                results.append([dict(doc) for doc in searched[key]])
+            
+            return results
             
         except Exception as e:
             raise RetrievalError(f"Failed to retrieve documents: {str(e)}")
     
+    def _search(self, query_embedding, top_k: int) -> List[Dict[str, Any]]:
+        """Run the similarity search for one query embedding and format the results."""
+        # Query Postgres for similar embeddings
+        embedding_results = retrieve_similar_embeddings(
+            db_session=self.db_session,
+            user_id=self.user_id,
+            query_vector=query_embedding.tolist(),
+            k=top_k
+        )
+        
+        # Format results
+        formatted_results = []
+        for result in embedding_results:
+            metadata = result.get('metadata', {})
+            
+            # Extract text content from metadata
+            text_content = metadata.get('text', '')
+            if not text_content:
+                continue
+            
+            # Create snippet (first SNIPPET_LENGTH chars)
+            snippet = text_content[:SNIPPET_LENGTH] + "..." if len(text_content) > SNIPPET_LENGTH else text_content
+            
+            formatted_results.append({
+                'doc_id': result['id'],
+                'title': metadata.get('title', 'Unknown'),
+                'snippet': snippet,
+                'score': result['similarity_score'],
+                'filename': metadata.get('filename', 'Unknown'),
+                'full_text': text_content,
+                'message_id': result['message_id'],
+                'chunk_index': metadata.get('chunk_index', 0)
+            })
+        
+        return formatted_results
+    
     def get_collection_stats(self) -> Dict[str, Any]:
         """
         Get statistics about the collection.
@@ -95,53 +149,34 @@ class DocumentRetriever(IRetriever):
             Dictionary with collection statistics
         """
         try:
-            from embedding_storage import get_embedding_stats
-            
-            # Get embedding statistics
-            stats = get_embedding_stats(self.db_session, self.user_id)
-            
-            if "error" in stats:
-                return {
-                    "error": stats["error"],
-                    "total_documents": 0,
-                    "unique_files": 0,
-                    "file_types": {},
-                    "collection_name": "postgres_embeddings"
-                }
-            
-            # Get file type distribution from metadata using ORM
-            file_types_result = self.db_session.query(
-                func.json_extract_path_text(EmbeddingDB.embedding_metadata, 'file_type').label('file_type'),
+            user_rows = EmbeddingDB.user_id == self.user_id
+            
+            # ->> on the JSONB column matches the per-user expression indexes
+            file_type = EmbeddingDB.embedding_metadata['file_type'].astext
+            filename = EmbeddingDB.embedding_metadata['filename'].astext
+            
+            # File type distribution, folded into a JSON object by the database
+            type_counts = select(
+                file_type.label('file_type'),
                 func.count().label('count')
-            ).filter(
-                and_(
-                    EmbeddingDB.user_id == self.user_id,
-                    func.json_extract_path_text(EmbeddingDB.embedding_metadata, 'file_type').isnot(None)
-                )
-            ).group_by(
-                func.json_extract_path_text(EmbeddingDB.embedding_metadata, 'file_type')
-            ).all()
-            
-            file_types = {row.file_type: row.count for row in file_types_result if row.file_type}
-            
-            # Get unique filenames using ORM
-            filenames_result = self.db_session.query(
-                func.json_extract_path_text(EmbeddingDB.embedding_metadata, 'filename').label('filename')
-            ).filter(
-                and_(
-                    EmbeddingDB.user_id == self.user_id,
-                    func.json_extract_path_text(EmbeddingDB.embedding_metadata, 'filename').isnot(None)
-                )
-            ).distinct().all()
-            
-            unique_files = len([row.filename for row in filenames_result if row.filename])
+            ).where(user_rows, file_type != '').group_by(file_type).subquery()
+            
+            # Fetch every statistic in a single round trip
+            row = self.db_session.execute(select(
+                select(func.count()).select_from(EmbeddingDB).where(user_rows)
+                .scalar_subquery().label('total_documents'),
+                select(func.count(filename.distinct())).where(user_rows, filename != '')
+                .scalar_subquery().label('unique_files'),
+                select(func.jsonb_object_agg(type_counts.c.file_type, type_counts.c.count))
+                .scalar_subquery().label('file_types')
+            )).one()
             
             return {
-                "total_documents": stats["total_embeddings"],
-                "unique_files": unique_files,
-                "file_types": file_types,
+                "total_documents": row.total_documents,
+                "unique_files": row.unique_files,
+                "file_types": row.file_types or {},
                 "collection_name": "postgres_embeddings",
-                "embedding_dimension": stats["embedding_dimension"]
+                "embedding_dimension": EMBEDDING_DIM
             }
             
         except Exception as e:
@@ -159,6 +194,7 @@ if __name__ == "__main__":
     from sentence_transformers import SentenceTransformer
     from auth.database import SessionLocal
     
+    logging.basicConfig(level=logging.INFO)
     print("Testing Postgres Document Retriever...")
     try:
         # Initialize database session
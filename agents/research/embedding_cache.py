@@ -0,0 +1,141 @@
+"""
+Embedding Cache for Multi-hop Research Agent
+Caches query embeddings so repeated subqueries skip the model forward pass.
+"""
+
+from typing import Any, Dict, List
+from collections import OrderedDict
+import hashlib
+import threading
+import weakref
+import numpy as np
+
+
+# Maximum number of query embeddings kept per embedding model
+EMBEDDING_CACHE_SIZE = 10000
+
+
+def _normalize(text: str) -> str:
+    """Collapse runs of whitespace, which the tokenizer ignores, so equivalent queries share a cache entry."""
+    return ' '.join(text.split())
+
+
+def _cache_key(text: str) -> str:
+    """Cache key of an already normalized text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddingProvider:
+    """
+    LRU cache of normalized query embeddings in front of a sentence transformer.
+    """
+
+    def __init__(self, model: Any, maxsize: int = EMBEDDING_CACHE_SIZE):
+        """
+        Initialize the embedding provider.
+
+        Args:
+            model: Sentence transformer model used on cache misses
+            maxsize: Maximum number of embeddings to keep
+        """
+        self.model = model
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, text: str) -> np.ndarray:
+        """
+        Get the normalized embedding for a text, computing it on a cache miss.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            Read-only embedding vector
+        """
+        text = _normalize(text)
+        key = _cache_key(text)
+
+        with self._lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._cache.move_to_end(key)
+                return embedding
+
+        embedding = np.asarray(self.model.encode([text], normalize_embeddings=True)[0])
+        embedding.setflags(write=False)
+
+        with self._lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        return embedding
+
+    def encode_many(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Get normalized embeddings for several texts, encoding all misses in one batch.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Read-only embedding vectors in the same order as texts
+        """
+        texts = [_normalize(text) for text in texts]
+        keys = [_cache_key(text) for text in texts]
+        embeddings: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in keys:
+                embedding = self._cache.get(key)
+                if embedding is not None:
+                    self._cache.move_to_end(key)
+                    embeddings[key] = embedding
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in embeddings}
+        if missing:
+            encoded = self.model.encode(list(missing.values()), normalize_embeddings=True)
+            with self._lock:
+                for key, row in zip(missing, encoded):
+                    embedding = np.asarray(row)
+                    embedding.setflags(write=False)
+                    embeddings[key] = embedding
+                    self._cache[key] = embedding
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+
+        return [embeddings[key] for key in keys]
+
+    def clear(self) -> None:
+        """Remove all cached embeddings."""
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+# One provider per model object, so the cache outlives per-request retrievers
+_providers: "weakref.WeakKeyDictionary[Any, CachedEmbeddingProvider]" = weakref.WeakKeyDictionary()
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(model: Any) -> CachedEmbeddingProvider:
+    """
+    Get the shared embedding provider for a model.
+
+    Args:
+        model: Sentence transformer model
+
+    Returns:
+        CachedEmbeddingProvider bound to the model
+    """
+    with _providers_lock:
+        provider = _providers.get(model)
+        if provider is None:
+            provider = CachedEmbeddingProvider(model)
+            _providers[model] = provider
+        return provider
@@ -3,11 +3,93 @@ Query Planner for Multi-hop Research Agent
 Handles subquery generation and query planning.
 """
 
-from typing import List
+from typing import List, Tuple
 import re
 from ..shared.interfaces import IQueryPlanner
 
 
+# Maximum number of subqueries generated per question
+MAX_SUBQUERIES = 5
+
+# Question patterns and the subquery templates they trigger
+SUBQUERY_TEMPLATES = {
+    r'what is|what are|define|definition': [
+        "definition of {question}",
+        "what is {question}",
+        "explain {question}",
+        "overview of {question}"
+    ],
+    r'how does|how do|how to|how can': [
+        "how {question}",
+        "mechanism of {question}",
+        "process of {question}",
+        "steps for {question}"
+    ],
+    r'why|reasons|benefits|advantages|disadvantages': [
+        "why {question}",
+        "benefits of {question}",
+        "advantages of {question}",
+        "reasons for {question}"
+    ],
+    r'compare|comparison|vs|versus|difference': [
+        "comparison of {question}",
+        "differences between {question}",
+        "{question} comparison",
+        "pros and cons of {question}"
+    ],
+    r'best|top|recommend|suggest|choose': [
+        "best {question}",
+        "top {question}",
+        "recommended {question}",
+        "popular {question}"
+    ],
+    r'example|examples|case study|use case': [
+        "examples of {question}",
+        "case studies of {question}",
+        "use cases for {question}",
+        "real world {question}"
+    ],
+    r'future|trends|development|evolution': [
+        "future of {question}",
+        "trends in {question}",
+        "development of {question}",
+        "evolution of {question}"
+    ]
+}
+
+# Templates used when no question pattern matches
+GENERIC_SUBQUERY_TEMPLATES = [
+    "what is {question}",
+    "how does {question} work",
+    "benefits of {question}",
+    "examples of {question}",
+    "applications of {question}"
+]
+
+# Common stop words removed from key terms
+STOP_WORDS = frozenset({
+    'what', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'how', 'why', 'when', 'where', 'who', 'which', 'that', 'this', 'these', 'those', 'do', 'does', 'did',
+    'can', 'could', 'should', 'would', 'will', 'may', 'might', 'must', 'have', 'has', 'had', 'be', 'been',
+    'being', 'was', 'were', 'am'
+})
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+
+def _compile_templates(templates: List[str]) -> Tuple[Tuple[str, str], ...]:
+    """Split templates into (prefix, suffix) pairs around the question placeholder."""
+    return tuple(tuple(template.split("{question}", 1)) for template in templates)
+
+
+# Patterns and templates compiled once at import
+_COMPILED_TEMPLATES = tuple(
+    (re.compile(pattern), _compile_templates(templates))
+    for pattern, templates in SUBQUERY_TEMPLATES.items()
+)
+_COMPILED_GENERIC_TEMPLATES = _compile_templates(GENERIC_SUBQUERY_TEMPLATES)
+
+
 class QueryPlanner(IQueryPlanner):
     """
     Query planner that breaks down complex research questions into focused subqueries.
@@ -15,50 +97,7 @@ class QueryPlanner(IQueryPlanner):
     
     def __init__(self):
         """Initialize the query planner."""
-        self.patterns = {
-            r'what is|what are|define|definition': [
-                "definition of {question}",
-                "what is {question}",
-                "explain {question}",
-                "overview of {question}"
-            ],
-            r'how does|how do|how to|how can': [
-                "how {question}",
-                "mechanism of {question}",
-                "process of {question}",
-                "steps for {question}"
-            ],
-            r'why|reasons|benefits|advantages|disadvantages': [
-                "why {question}",
-                "benefits of {question}",
-                "advantages of {question}",
-                "reasons for {question}"
-            ],
-            r'compare|comparison|vs|versus|difference': [
-                "comparison of {question}",
-                "differences between {question}",
-                "{question} comparison",
-                "pros and cons of {question}"
-            ],
-            r'best|top|recommend|suggest|choose': [
-                "best {question}",
-                "top {question}",
-                "recommended {question}",
-                "popular {question}"
-            ],
-            r'example|examples|case study|use case': [
-                "examples of {question}",
-                "case studies of {question}",
-                "use cases for {question}",
-                "real world {question}"
-            ],
-            r'future|trends|development|evolution': [
-                "future of {question}",
-                "trends in {question}",
-                "development of {question}",
-                "evolution of {question}"
-            ]
-        }
+        self.patterns = SUBQUERY_TEMPLATES
     
     def generate_subqueries(self, question: str) -> List[str]:
         """
@@ -72,37 +111,22 @@ class QueryPlanner(IQueryPlanner):
         """
         # Clean the question
         question = question.strip().lower()
+        base_terms = " ".join(self._extract_key_terms(question))
         
-        # Find matching patterns
-        subqueries = []
+        # Collect templates of every matching pattern, in table order
+        matched = [templates for pattern, templates in _COMPILED_TEMPLATES if pattern.search(question)]
+        if not matched:
+            matched = [_COMPILED_GENERIC_TEMPLATES]
         
-        for pattern, templates in self.patterns.items():
-            if re.search(pattern, question):
-                # Extract key terms from the question
-                key_terms = self._extract_key_terms(question)
-                
-                for template in templates:
-                    # Replace placeholder with actual terms
-                    subquery = template.replace("{question}", " ".join(key_terms))
-                    subqueries.append(subquery)
+        # Materialize unique subqueries up to the limit
+        subqueries = {}
+        for templates in matched:
+            for prefix, suffix in templates:
+                subqueries[prefix + base_terms + suffix] = None
+                if len(subqueries) == MAX_SUBQUERIES:
+                    return list(subqueries)
         
-        # If no patterns match, create generic subqueries
-        if not subqueries:
-            key_terms = self._extract_key_terms(question)
-            base_terms = " ".join(key_terms)
-            
-            subqueries = [
-                f"what is {base_terms}",
-                f"how does {base_terms} work",
-                f"benefits of {base_terms}",
-                f"examples of {base_terms}",
-                f"applications of {base_terms}"
-            ]
-        
-        # Remove duplicates and limit to reasonable number
-        subqueries = list(dict.fromkeys(subqueries))[:5]
-        
-        return subqueries
+        return list(subqueries)
     
     def _extract_key_terms(self, text: str) -> List[str]:
         """
@@ -114,19 +138,11 @@ class QueryPlanner(IQueryPlanner):
         Returns:
             List of key terms
         """
-        # Common stop words to remove
-        stop_words = {
-            'what', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-            'how', 'why', 'when', 'where', 'who', 'which', 'that', 'this', 'these', 'those', 'do', 'does', 'did',
-            'can', 'could', 'should', 'would', 'will', 'may', 'might', 'must', 'have', 'has', 'had', 'be', 'been',
-            'being', 'was', 'were', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being'
-        }
-        
         # Clean and split text
-        words = re.findall(r'\b\w+\b', text.lower())
+        words = WORD_PATTERN.findall(text.lower())
         
         # Filter out stop words and short words
-        key_terms = [word for word in words if len(word) > 2 and word not in stop_words]
+        key_terms = [word for word in words if len(word) > 2 and word not in STOP_WORDS]
         
         return key_terms
 
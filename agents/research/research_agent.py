@@ -3,14 +3,25 @@ Research Agent for Multi-hop Research
 Main research agent that orchestrates the research process.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Union
+from dataclasses import replace
+import logging
 import time
 from ..shared.interfaces import IAgent, IRetriever, ILLMClient
 from ..shared.models import ResearchResult, SubqueryResult
 from ..shared.exceptions import AgentError
 from .query_planner import QueryPlanner
 from .document_retriever import DocumentRetriever
-from .answer_synthesizer import AnswerSynthesizer
+from .answer_synthesizer import AnswerSynthesizer, NO_RELEVANT_INFORMATION
+from .semantic_cache import SemanticCache
+
+logger = logging.getLogger(__name__)
+
+# Answer returned without synthesis when no subquery retrieved any documents
+NO_DOCUMENTS_ANSWER = (
+    "I couldn't find any relevant documents in the knowledge base to answer your question. "
+    "Try uploading documents on this topic or rephrasing your question."
+)
 
 
 class ResearchAgent(IAgent):
@@ -19,7 +30,8 @@ class ResearchAgent(IAgent):
     """
     
     def __init__(self, retriever: IRetriever, llm_client: ILLMClient = None, 
-                 use_llm: bool = True, ollama_model: str = "mistral:latest"):
+                 use_llm: bool = True, ollama_model: str = "mistral:latest",
+                 semantic_cache: Optional[SemanticCache] = None):
         """
         Initialize research agent.
         
@@ -28,16 +40,19 @@ class ResearchAgent(IAgent):
             llm_client: Optional LLM client for advanced processing
             use_llm: Whether to use LLM for processing
             ollama_model: Ollama model to use (if using Ollama)
+            semantic_cache: Optional cache of results for semantically similar questions.
+                Requires a retriever that provides embed_query.
         """
         self.retriever = retriever
         self.llm_client = llm_client
         self.use_llm = use_llm and llm_client is not None and llm_client.is_available()
+        self.semantic_cache = semantic_cache
         
         # Initialize components
         self.query_planner = QueryPlanner()
         self.answer_synthesizer = AnswerSynthesizer(llm_client)
         
-        print(f"Research agent initialized (LLM: {'enabled' if self.use_llm else 'disabled'})")
+        logger.debug("Research agent initialized (LLM: %s)", 'enabled' if self.use_llm else 'disabled')
     
     def process(self, question: str, per_sub_k: int = 3) -> ResearchResult:
         """
@@ -53,90 +68,280 @@ class ResearchAgent(IAgent):
         start_time = time.time()
         
         try:
-            print(f"\nResearching: {question}")
+            cache_scope, question_embedding = self._semantic_cache_key(question, per_sub_k)
+            cached = self._get_cached_result(cache_scope, question_embedding, question, start_time)
+            if cached is not None:
+                return cached
             
-            # Generate subqueries
-            if self.use_llm:
-                subqueries = self.llm_client.generate_subqueries(question)
+            subqueries, subquery_results, all_citations = self._research(question, per_sub_k)
+            
+            # Generate final synthesis, skipping it when nothing was retrieved
+            if all_citations:
+                final_answer = self.answer_synthesizer.synthesize_answer(question, subquery_results)
             else:
-                subqueries = self.query_planner.generate_subqueries(question)
-            
-            print(f"Generated {len(subqueries)} subqueries")
-            
-            # Process each subquery
-            subquery_results = []
-            all_citations = []
-            
-            for i, subquery in enumerate(subqueries, 1):
-                print(f"\nSubquery {i}: {subquery}")
-                
-                # Retrieve documents for this subquery
-                try:
-                    documents = self.retriever.retrieve(subquery, top_k=per_sub_k)
-                    
-                    if documents:
-                        # Summarize results for this subquery
-                        summary = self.answer_synthesizer.summarize_documents(documents, subquery)
-                        
-                        subquery_result = SubqueryResult(
-                            subquery=subquery,
-                            summary=summary,
-                            documents=documents,
-                            success=True
-                        )
-                        
-                        # Collect citations
-                        for doc in documents:
-                            if doc not in all_citations:
-                                all_citations.append(doc)
-                        
-                        print(f"  Found {len(documents)} relevant documents")
-                    else:
-                        print(f"  No relevant documents found")
-                        subquery_result = SubqueryResult(
-                            subquery=subquery,
-                            summary="No relevant information found for this aspect.",
-                            documents=[],
-                            success=False,
-                            error="No documents found"
-                        )
-                    
-                    subquery_results.append(subquery_result)
-                    
-                except Exception as e:
-                    print(f"  Error processing subquery: {e}")
-                    subquery_result = SubqueryResult(
-                        subquery=subquery,
-                        summary="Error processing this aspect.",
-                        documents=[],
-                        success=False,
-                        error=str(e)
-                    )
-                    subquery_results.append(subquery_result)
-            
-            # Generate final synthesis
-            final_answer = self.answer_synthesizer.synthesize_answer(question, subquery_results)
+                final_answer = NO_DOCUMENTS_ANSWER
             
             processing_time = time.time() - start_time
             
-            return ResearchResult(
+            result = ResearchResult(
                 question=question,
                 answer=final_answer,
                 subqueries=subquery_results,
                 citations=all_citations,
                 total_documents=len(all_citations),
                 processing_time=processing_time,
-                metadata={
-                    'use_llm': self.use_llm,
-                    'subquery_count': len(subqueries),
-                    'successful_subqueries': len([r for r in subquery_results if r.success])
-                }
+                metadata=self._result_metadata(subqueries, subquery_results)
             )
             
+            self._put_cached_result(cache_scope, question_embedding, result)
+            
+            return result
+            
         except Exception as e:
             raise AgentError(f"Failed to process research question: {str(e)}")
     
-    def ask(self, question: str, per_sub_k: int = 3) -> Dict[str, Any]:
+    def _semantic_cache_key(self, question: str, per_sub_k: int) -> Tuple[Any, Any]:
+        """
+        Get the semantic cache scope and question embedding.
+        
+        Returns:
+            Tuple of (scope, embedding); embedding is None when caching is disabled
+        """
+        embed_query = getattr(self.retriever, 'embed_query', None)
+        if self.semantic_cache is None or embed_query is None:
+            return None, None
+        
+        scope = (
+            getattr(self.retriever, 'user_id', None),
+            self.use_llm,
+            getattr(self.llm_client, 'model_name', None) if self.use_llm else None,
+            per_sub_k
+        )
+        return scope, embed_query(question)
+    
+    def _get_cached_result(self, cache_scope: Any, question_embedding: Any,
+                           question: str, start_time: float) -> Optional[ResearchResult]:
+        """Return a private copy of the semantically cached result for a question, or None."""
+        if question_embedding is None:
+            return None
+        
+        cached = self.semantic_cache.get(cache_scope, question_embedding)
+        if cached is None:
+            return None
+        
+        logger.debug("Semantic cache hit: %s", question)
+        return self._copy_result(
+            cached,
+            question=question,
+            processing_time=time.time() - start_time,
+            metadata={**(cached.metadata or {}), 'semantic_cache_hit': True}
+        )
+    
+    def _put_cached_result(self, cache_scope: Any, question_embedding: Any, result: ResearchResult) -> None:
+        """Cache a private copy of a result, skipping answers not backed by documents."""
+        if question_embedding is not None and result.citations:
+            self.semantic_cache.put(cache_scope, question_embedding, self._copy_result(result))
+    
+    @staticmethod
+    def _copy_result(result: ResearchResult, **changes: Any) -> ResearchResult:
+        """
+        Copy a result down to its document dictionaries, so callers that mutate
+        what they receive cannot corrupt a cached entry.
+        """
+        fields = {
+            'subqueries': [replace(sq, documents=[dict(doc) for doc in sq.documents])
+                           for sq in result.subqueries],
+            'citations': [dict(doc) for doc in result.citations],
+            'metadata': dict(result.metadata) if result.metadata is not None else None,
+        }
+        fields.update(changes)
+        return replace(result, **fields)
+    
+    def _result_metadata(self, subqueries: List[str],
+                         subquery_results: List[SubqueryResult]) -> Dict[str, Any]:
+        """Build the metadata recorded on a research result."""
+        return {
+            'use_llm': self.use_llm,
+            'subquery_count': len(subqueries),
+            'successful_subqueries': len([r for r in subquery_results if r.success])
+        }
+    
+    def _research(self, question: str,
+                  per_sub_k: int) -> Tuple[List[str], List[SubqueryResult], List[Dict[str, Any]]]:
+        """
+        Run the multi-hop research steps that precede answer synthesis.
+        
+        Args:
+            question: Research question
+            per_sub_k: Number of documents to retrieve per subquery
+            
+        Returns:
+            Tuple of (subqueries, subquery results, deduplicated citations)
+        """
+        # Generate subqueries
+        if self.use_llm:
+            subqueries = self.llm_client.generate_subqueries(question)
+        else:
+            subqueries = self.query_planner.generate_subqueries(question)
+        
+        logger.debug("Researching %r with %d subqueries", question, len(subqueries))
+        
+        # Retrieve every subquery, then summarize them all in one batch
+        subquery_results = self._process_subqueries(subqueries, per_sub_k)
+        
+        # Collect citations in subquery order, once per document
+        all_citations = []
+        seen_citations = set()
+        for subquery_result in subquery_results:
+            for doc in subquery_result.documents:
+                key = self._citation_key(doc)
+                if key not in seen_citations:
+                    seen_citations.add(key)
+                    all_citations.append(doc)
+        
+        return subqueries, subquery_results, all_citations
+    
+    def _process_subqueries(self, subqueries: List[str], per_sub_k: int) -> List[SubqueryResult]:
+        """
+        Retrieve documents for all subqueries, then summarize them in a single
+        batched pass.
+        
+        Args:
+            subqueries: Subqueries to process
+            per_sub_k: Number of documents to retrieve per subquery
+            
+        Returns:
+            List of SubqueryResult in the same order as subqueries
+        """
+        if not subqueries:
+            return []
+        
+        retrievals = self._retrieve_all(subqueries, per_sub_k)
+        
+        subquery_results = [failure for _, failure in retrievals]
+        found = [i for i, (documents, failure) in enumerate(retrievals) if failure is None]
+        if not found:
+            return subquery_results
+        
+        found_subqueries = [subqueries[i] for i in found]
+        found_documents = [retrievals[i][0] for i in found]
+        
+        try:
+            summaries = self.answer_synthesizer.summarize_documents_batch(
+                found_documents, found_subqueries
+            )
+        except Exception as e:
+            logger.warning("Error summarizing subqueries: %s", e)
+            for i in found:
+                subquery_results[i] = SubqueryResult(
+                    subquery=subqueries[i],
+                    summary="Error processing this aspect.",
+                    documents=[],
+                    success=False,
+                    error=str(e)
+                )
+            return subquery_results
+        
+        for i, documents, summary in zip(found, found_documents, summaries):
+            subquery_results[i] = SubqueryResult(
+                subquery=subqueries[i],
+                summary=summary,
+                documents=documents,
+                success=True
+            )
+        
+        return subquery_results
+    
+    def _retrieve_all(self, subqueries: List[str],
+                      per_sub_k: int) -> List[Tuple[List[Dict[str, Any]], Optional[SubqueryResult]]]:
+        """
+        Retrieve documents for all subqueries.
+        
+        Retrievers implementing IRetriever are asked for every subquery in one
+        retrieve_many call. Otherwise, or if the batched call fails, subqueries
+        are retrieved one at a time so failures stay per subquery. The
+        retriever shares a single database session, so retrieval is sequential.
+        
+        Args:
+            subqueries: Subqueries to process
+            per_sub_k: Number of documents to retrieve per subquery
+            
+        Returns:
+            List of (documents, failure) tuples in the same order as subqueries
+        """
+        if isinstance(self.retriever, IRetriever):
+            try:
+                batches = self.retriever.retrieve_many(subqueries, top_k=per_sub_k)
+                return [self._retrieval_outcome(index, subquery, documents)
+                        for index, (subquery, documents) in enumerate(zip(subqueries, batches), 1)]
+            except Exception as e:
+                logger.warning("Batched retrieval failed, retrying subqueries individually: %s", e)
+        
+        return [self._retrieve_for_subquery(index, subquery, per_sub_k)
+                for index, subquery in enumerate(subqueries, 1)]
+    
+    def _retrieve_for_subquery(self, index: int, subquery: str,
+                               per_sub_k: int) -> Tuple[List[Dict[str, Any]], Optional[SubqueryResult]]:
+        """
+        Retrieve documents for a single subquery.
+        
+        Args:
+            index: 1-based position of the subquery
+            subquery: The subquery to process
+            per_sub_k: Number of documents to retrieve
+            
+        Returns:
+            Tuple of (documents, failure). failure is a SubqueryResult when no
+            documents were found or retrieval failed, otherwise None.
+        """
+        try:
+            documents = self.retriever.retrieve(subquery, top_k=per_sub_k)
+        except Exception as e:
+            logger.warning("Subquery %d %r failed: %s", index, subquery, e)
+            return [], SubqueryResult(
+                subquery=subquery,
+                summary="Error processing this aspect.",
+                documents=[],
+                success=False,
+                error=str(e)
+            )
+        
+        return self._retrieval_outcome(index, subquery, documents)
+    
+    def _retrieval_outcome(self, index: int, subquery: str,
+                           documents: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[SubqueryResult]]:
+        """Pair retrieved documents with a failure result when nothing was found."""
+        if not documents:
+            logger.debug("Subquery %d %r: no relevant documents found", index, subquery)
+            return [], SubqueryResult(
+                subquery=subquery,
+                summary=NO_RELEVANT_INFORMATION,
+                documents=[],
+                success=False,
+                error="No documents found"
+            )
+        
+        logger.debug("Subquery %d %r: found %d relevant documents", index, subquery, len(documents))
+        return documents, None
+    
+    @staticmethod
+    def _citation_key(doc: Dict[str, Any]) -> Any:
+        """
+        Get a hashable identity for a retrieved document.
+        
+        Args:
+            doc: Retrieved document dictionary
+            
+        Returns:
+            The document ID, or a key derived from its source and content
+        """
+        doc_id = doc.get('doc_id')
+        if doc_id is not None:
+            return doc_id
+        return (doc.get('title'), doc.get('filename'), doc.get('chunk_index'), hash(doc.get('full_text', '')))
+    
+    def ask(self, question: str, per_sub_k: int = 3,
+            stream: bool = False) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
         """
         Ask a research question and get a multi-hop reasoned answer.
         Legacy method for backward compatibility.
@@ -144,28 +349,95 @@ class ResearchAgent(IAgent):
         Args:
             question: Research question
             per_sub_k: Number of documents to retrieve per subquery
+            stream: Whether to return a generator that yields the answer as it is generated
             
         Returns:
-            Dictionary containing answer, subqueries, and citations
+            Dictionary containing answer, subqueries, and citations, or a generator
+            of partial result dictionaries when stream is True
         """
+        if stream:
+            return self._ask_stream(question, per_sub_k)
+        
         result = self.process(question, per_sub_k)
         
         # Convert to legacy format
         return {
             'question': result.question,
             'answer': result.answer,
-            'subqueries': [
-                {
-                    'subquery': sq.subquery,
-                    'summary': sq.summary,
-                    'documents': sq.documents
-                }
-                for sq in result.subqueries
-            ],
+            'subqueries': self._legacy_subqueries(result.subqueries),
             'citations': result.citations,
             'total_documents': result.total_documents
         }
     
+    def _ask_stream(self, question: str, per_sub_k: int) -> Iterator[Dict[str, Any]]:
+        """
+        Yield partial legacy results while the final answer is generated.
+        
+        The first item carries subqueries and citations, each following item
+        carries an answer fragment in 'delta', and the last item has 'done' set
+        with the complete answer. A semantic cache hit is yielded as a single
+        fragment, and completed answers are cached like those from process.
+        """
+        start_time = time.time()
+        try:
+            cache_scope, question_embedding = self._semantic_cache_key(question, per_sub_k)
+            cached = self._get_cached_result(cache_scope, question_embedding, question, start_time)
+            if cached is None:
+                subqueries, subquery_results, all_citations = self._research(question, per_sub_k)
+            else:
+                subquery_results, all_citations = cached.subqueries, cached.citations
+        except Exception as e:
+            raise AgentError(f"Failed to process research question: {str(e)}")
+        
+        result = {
+            'question': question,
+            'answer': '',
+            'subqueries': self._legacy_subqueries(subquery_results),
+            'citations': all_citations,
+            'total_documents': len(all_citations),
+            'delta': '',
+            'done': False
+        }
+        yield result
+        
+        if cached is not None:
+            fragments = iter([cached.answer])
+        elif all_citations:
+            fragments = self.answer_synthesizer.synthesize_answer_stream(question, subquery_results)
+        else:
+            fragments = iter([NO_DOCUMENTS_ANSWER])
+        
+        answer_parts = []
+        for fragment in fragments:
+            answer_parts.append(fragment)
+            yield {'question': question, 'delta': fragment, 'done': False}
+        
+        answer = ''.join(answer_parts)
+        if cached is None:
+            self._put_cached_result(cache_scope, question_embedding, ResearchResult(
+                question=question,
+                answer=answer,
+                subqueries=subquery_results,
+                citations=all_citations,
+                total_documents=len(all_citations),
+                processing_time=time.time() - start_time,
+                metadata=self._result_metadata(subqueries, subquery_results)
+            ))
+        
+        yield {**result, 'answer': answer, 'done': True}
+    
+    @staticmethod
+    def _legacy_subqueries(subquery_results: List[SubqueryResult]) -> List[Dict[str, Any]]:
+        """Convert subquery results to the legacy dictionary format."""
+        return [
+            {
+                'subquery': sq.subquery,
+                'summary': sq.summary,
+                'documents': sq.documents
+            }
+            for sq in subquery_results
+        ]
+    
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the document collection."""
         if hasattr(self.retriever, 'get_collection_stats'):
@@ -180,6 +452,7 @@ if __name__ == "__main__":
     from auth.database import SessionLocal
     from ollama_client import OllamaClient
     
+    logging.basicConfig(level=logging.INFO)
     print("Initializing research agent...")
     
     try:
@@ -0,0 +1,129 @@
+"""
+Semantic Cache for Multi-hop Research Agent
+Reuses research results for questions that are semantically close to earlier ones.
+"""
+
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import threading
+import time
+import numpy as np
+from ..shared.models import ResearchResult
+
+
+# Minimum cosine similarity between question embeddings for a cache hit
+SEMANTIC_CACHE_THRESHOLD = 0.93
+
+# Maximum number of cached results per scope
+SEMANTIC_CACHE_SIZE = 1000
+
+# Seconds before a cached result is considered stale
+SEMANTIC_CACHE_TTL = 3600
+
+
+class _ScopeEntries:
+    """Cached entries for one scope with a lazily stacked embedding matrix."""
+
+    def __init__(self):
+        self.entries: "OrderedDict[int, Tuple[np.ndarray, ResearchResult, float]]" = OrderedDict()
+        self.next_key = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: Optional[list] = None
+
+    def invalidate_matrix(self) -> None:
+        self._matrix = None
+        self._keys = None
+
+    def matrix(self) -> Tuple[np.ndarray, list]:
+        if self._matrix is None:
+            self._keys = list(self.entries.keys())
+            self._matrix = np.vstack([self.entries[key][0] for key in self._keys])
+        return self._matrix, self._keys
+
+
+class SemanticCache:
+    """
+    Similarity cache of research results keyed by normalized question embeddings.
+
+    Entries are grouped by scope, a tuple whose first element is the user ID,
+    so results never cross users or agent configurations.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 maxsize: int = SEMANTIC_CACHE_SIZE, ttl: float = SEMANTIC_CACHE_TTL):
+        """
+        Initialize the semantic cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a cache hit
+            maxsize: Maximum number of entries per scope
+            ttl: Seconds before an entry expires
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._scopes: Dict[Hashable, _ScopeEntries] = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope: Hashable, embedding: np.ndarray) -> Optional[ResearchResult]:
+        """
+        Find a cached result for a question embedding.
+
+        Args:
+            scope: Cache scope, starting with the user ID
+            embedding: Normalized question embedding
+
+        Returns:
+            The cached ResearchResult of the most similar question, or None
+        """
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if not entries or not entries.entries:
+                return None
+
+            matrix, keys = entries.matrix()
+            scores = matrix @ np.asarray(embedding, dtype=matrix.dtype)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            key = keys[best]
+            _, result, created_at = entries.entries[key]
+            if time.time() - created_at > self.ttl:
+                del entries.entries[key]
+                entries.invalidate_matrix()
+                return None
+
+            entries.entries.move_to_end(key)
+            return result
+
+    def put(self, scope: Hashable, embedding: np.ndarray, result: ResearchResult) -> None:
+        """
+        Store a research result for a question embedding.
+
+        Args:
+            scope: Cache scope, starting with the user ID
+            embedding: Normalized question embedding
+            result: Research result to cache
+        """
+        with self._lock:
+            entries = self._scopes.setdefault(scope, _ScopeEntries())
+            entries.entries[entries.next_key] = (np.asarray(embedding, dtype=np.float32), result, time.time())
+            entries.next_key += 1
+            while len(entries.entries) > self.maxsize:
+                entries.entries.popitem(last=False)
+            entries.invalidate_matrix()
+
+    def invalidate(self, user_id: Optional[Any] = None) -> None:
+        """
+        Drop cached results, e.g. after a user's documents change.
+
+        Args:
+            user_id: Only drop scopes belonging to this user (all scopes if None)
+        """
+        with self._lock:
+            if user_id is None:
+                self._scopes.clear()
+                return
+            for scope in [s for s in self._scopes if isinstance(s, tuple) and s and s[0] == user_id]:
+                del self._scopes[scope]
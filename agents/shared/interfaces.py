@@ -3,7 +3,8 @@ Shared interfaces for the multi-hop research agent system.
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from .models import ResearchResult, ChatMessage, Conversation
 
 
@@ -23,6 +24,10 @@ class IRetriever(ABC):
     def retrieve(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """Retrieve relevant documents for a query."""
         pass
+    
+    def retrieve_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Retrieve relevant documents for several queries, in query order."""
+        return [self.retrieve(query, top_k) for query in queries]
 
 
 class ILLMClient(ABC):
@@ -77,6 +82,7 @@ class IConversationManager(ABC):
         pass
     
     @abstractmethod
-    def list_conversations(self) -> List[Dict[str, Any]]:
-        """List all conversations."""
+    def list_conversations(self, limit: Optional[int] = None,
+                           before: Optional[Tuple[datetime, str]] = None) -> List[Dict[str, Any]]:
+        """List conversations, most recently updated first, optionally one page at a time."""
         pass
@@ -2,14 +2,16 @@
 Shared data models for the multi-hop research agent system.
 """
 
-from dataclasses import dataclass, asdict
+from collections import Counter
+from dataclasses import dataclass, asdict, field
 from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 from enum import Enum
+import sys
 import uuid
 
 # SQLAlchemy imports for database models
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, func
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Index, func
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -17,6 +19,13 @@ from pgvector.sqlalchemy import Vector
 import os
 
 
+# Number of leading user messages a conversation tracks incrementally
+TRACKED_USER_MESSAGES = 3
+
+# Slotted dataclasses (no per-instance __dict__) where the interpreter supports them (3.10+)
+SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
 class MessageRole(Enum):
     """Message roles in conversations."""
     USER = "user"
@@ -24,7 +33,7 @@ class MessageRole(Enum):
     SYSTEM = "system"
 
 
-@dataclass
+@dataclass(**SLOTS)
 class ChatMessage:
     """Represents a single message in a conversation."""
     id: str
@@ -57,6 +66,11 @@ class Conversation:
     context: Dict[str, Any]
     is_active: bool = True
     
+    def __post_init__(self):
+        # Leading user messages found so far and how many messages were scanned for them
+        self._leading_user_messages: List[ChatMessage] = []
+        self._scanned_messages = 0
+    
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization."""
         data = asdict(self)
@@ -88,6 +102,30 @@ class Conversation:
         self.updated_at = now
         return message
     
+    def get_first_user_messages(self, count: int = TRACKED_USER_MESSAGES) -> List[ChatMessage]:
+        """
+        Get the first user messages of the conversation.
+        
+        Up to TRACKED_USER_MESSAGES are tracked incrementally, so repeated calls
+        only scan messages added since the previous call.
+        """
+        if count > TRACKED_USER_MESSAGES:
+            return [msg for msg in self.messages if msg.role == 'user'][:count]
+        
+        # Start over if the message list was replaced by a shorter one
+        if self._scanned_messages > len(self.messages):
+            self._leading_user_messages = []
+            self._scanned_messages = 0
+        
+        while (len(self._leading_user_messages) < TRACKED_USER_MESSAGES
+               and self._scanned_messages < len(self.messages)):
+            msg = self.messages[self._scanned_messages]
+            self._scanned_messages += 1
+            if msg.role == 'user':
+                self._leading_user_messages.append(msg)
+        
+        return self._leading_user_messages[:count]
+    
     def get_recent_context(self, max_messages: int = 10) -> List[ChatMessage]:
         """Get recent messages for context."""
         return self.messages[-max_messages:] if self.messages else []
@@ -97,23 +135,23 @@ class Conversation:
         if not self.messages:
             return "No messages yet."
         
-        # Simple summary based on message count and recent topics
-        user_messages = [msg for msg in self.messages if msg.role == 'user']
-        assistant_messages = [msg for msg in self.messages if msg.role == 'assistant']
+        # Simple summary based on message counts, tallied in one pass
+        roles = Counter(msg.role for msg in self.messages)
         
         summary_parts = [
-            f"Conversation with {len(user_messages)} user messages and {len(assistant_messages)} assistant responses."
+            f"Conversation with {roles['user']} user messages and {roles['assistant']} assistant responses."
         ]
         
-        if user_messages:
+        first_user_messages = self.get_first_user_messages(1)
+        if first_user_messages:
             # Get the first few words of the first user message as topic hint
-            first_message = user_messages[0].content[:50]
+            first_message = first_user_messages[0].content[:50]
             summary_parts.append(f"Started with: {first_message}...")
         
         return " ".join(summary_parts)
 
 
-@dataclass
+@dataclass(**SLOTS)
 class SubqueryResult:
     """Result from processing a single subquery."""
     subquery: str
@@ -123,7 +161,7 @@ class SubqueryResult:
     error: Optional[str] = None
 
 
-@dataclass
+@dataclass(**SLOTS)
 class ResearchResult:
     """Complete result from a research query."""
     question: str
@@ -137,6 +175,16 @@ class ResearchResult:
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization."""
         return asdict(self)
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ResearchResult':
+        """Create from dictionary, restoring SubqueryResult objects."""
+        data = dict(data)
+        data['subqueries'] = [
+            sq if isinstance(sq, SubqueryResult) else SubqueryResult(**sq)
+            for sq in data.get('subqueries', [])
+        ]
+        return cls(**data)
 
 
 @dataclass
@@ -150,7 +198,7 @@ class ConversationInfo:
     is_active: bool
 
 
-@dataclass
+@dataclass(**SLOTS)
 class ChatResponse:
     """Response from chat agent."""
     conversation_id: str
@@ -162,6 +210,15 @@ class ChatResponse:
     timestamp: str
     research_result: Optional[ResearchResult] = None
     error: Optional[str] = None
+    research_result_dict: Optional[Dict[str, Any]] = field(default=None, repr=False, compare=False)
+    
+    def research_result_to_dict(self) -> Optional[Dict[str, Any]]:
+        """Serialize the research result once, reusing an already serialized copy."""
+        if self.research_result is None:
+            return None
+        if self.research_result_dict is None:
+            self.research_result_dict = self.research_result.to_dict()
+        return self.research_result_dict
 
 
 # SQLAlchemy Database Models
@@ -225,9 +282,13 @@ class ConversationDB(Base):
 class ChatMessageDB(Base):
     """SQLAlchemy model for chat messages stored in database."""
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Serves per-conversation lookups and their created_at ordering
+        Index("ix_chat_messages_conversation_created", "conversation_id", "created_at"),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=False, index=True)
+    conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=False)
     role = Column(String(20), nullable=False)  # 'user', 'assistant', 'system'
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
@@ -243,6 +304,16 @@ class ChatMessageDB(Base):
 class EmbeddingDB(Base):
     """SQLAlchemy model for embeddings stored in database with pgvector support."""
     __tablename__ = "embeddings"
+    __table_args__ = (
+        # Approximate nearest-neighbour index for similarity search; vectors are
+        # stored unit length, so inner product ranks them by cosine similarity
+        Index(
+            "ix_embeddings_vector_hnsw", "vector",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 24, "ef_construction": 128},
+            postgresql_ops={"vector": "vector_ip_ops"}
+        ),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     message_id = Column(String(36), ForeignKey("chat_messages.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -254,3 +325,15 @@ class EmbeddingDB(Base):
     # Relationships
     message = relationship("ChatMessageDB", back_populates="embeddings")
     user = relationship("User")
+
+
+# Per-user expression indexes for the metadata fields aggregated by collection stats;
+# the expressions match the ->> lookups in DocumentRetriever.get_collection_stats
+Index(
+    "ix_embeddings_user_file_type",
+    EmbeddingDB.user_id, EmbeddingDB.embedding_metadata["file_type"].astext
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_embeddings_user_filename",
+    EmbeddingDB.user_id, EmbeddingDB.embedding_metadata["filename"].astext
+).ddl_if(dialect="postgresql")
@@ -3,14 +3,16 @@ Multi-hop Research Agent API - Modular Version
 Updated to use the new modular agent architecture.
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
+from datetime import datetime
 from contextlib import asynccontextmanager
 import os
+import json
 import warnings
 import logging
 import threading
@@ -21,7 +23,7 @@ warnings.filterwarnings("ignore", message=".*bcrypt.*")
 logging.getLogger("passlib").setLevel(logging.ERROR)
 
 # Import modular components
-from agents.research import ResearchAgent, DocumentRetriever
+from agents.research import ResearchAgent, DocumentRetriever, SemanticCache
 from agents.chat import ChatAgent, ConversationManager
 from agents.shared.models import ResearchResult, ChatMessage, ConversationInfo
 from agents.shared.exceptions import AgentError
@@ -30,7 +32,7 @@ from agents.shared.exceptions import AgentError
 from report import generate_markdown_report, save_report
 from document_processing import process_file, SUPPORTED_EXTENSIONS, DocumentProcessingError
 from document_ingestion import process_and_store_file_content, get_user_document_stats
-from ollama_client import OllamaClient
+from ollama_client import OllamaClient, close_shared_clients
 from sentence_transformers import SentenceTransformer
 
 # Authentication imports
@@ -43,6 +45,16 @@ current_model = None
 available_models = []
 embedding_model = None
 
+# Research results for similar questions, shared across per-request agents
+research_cache = SemanticCache()
+
+# Sentence-transformers inference backend for the embedding model: torch, onnx or openvino
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# Optional exported model file for the onnx/openvino backends, e.g. an int8-quantized
+# onnx/model_qint8_avx512_vnni.onnx for faster CPU inference
+EMBEDDING_MODEL_FILE = os.getenv("EMBEDDING_MODEL_FILE")
+
 # Thread safety lock for model loading
 _model_lock = threading.Lock()
 
@@ -83,7 +95,8 @@ def get_research_agent_for_user(current_user: TokenData, db_session=None):
             llm_client = None
     
     # Create research agent
-    return ResearchAgent(retriever, llm_client, use_ollama, current_model)
+    return ResearchAgent(retriever, llm_client, use_ollama, current_model,
+                         semantic_cache=research_cache)
 
 def load_available_models():
     """Load available models from Ollama and store them in memory."""
@@ -180,8 +193,10 @@ async def lifespan(app: FastAPI):
         use_ollama = os.getenv("USE_OLLAMA", "false").lower() == "true"
         
         # Initialize embedding model
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        logging.info("Embedding model loaded successfully")
+        model_kwargs = {"file_name": EMBEDDING_MODEL_FILE} if EMBEDDING_MODEL_FILE else None
+        embedding_model = SentenceTransformer('all-MiniLM-L6-v2', backend=EMBEDDING_BACKEND,
+                                              model_kwargs=model_kwargs)
+        logging.info(f"Embedding model loaded successfully ({EMBEDDING_BACKEND} backend)")
         
         # Note: Document retriever and research agent are now created per-request
         # with user-scoped database sessions for multi-tenant support
@@ -200,6 +215,9 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logging.info("Shutting down Multi-hop Research Agent API...")
     
+    # Release pooled Ollama connections
+    close_shared_clients()
+    
     # Clear global variables
     available_models = []
     current_model = None
@@ -374,6 +392,47 @@ async def ask_question(
         if db_session:
             db_session.close()
 
+@app.post("/ask/stream")
+async def ask_question_stream(
+    request: QuestionRequest,
+    current_user: TokenData = Depends(get_current_active_user)
+):
+    """
+    Ask a research question and stream the answer as it is generated.
+    
+    Args:
+        request: Question request with question text and optional per_sub_k parameter
+        
+    Returns:
+        Newline-delimited JSON stream. The first line carries subqueries and
+        citations, following lines carry answer fragments in 'delta', and the
+        last line has 'done' set with the complete answer.
+    """
+    from auth.database import SessionLocal
+    db_session = SessionLocal()
+    
+    try:
+        # Get user-scoped research agent
+        user_research_agent = get_research_agent_for_user(current_user, db_session)
+    except Exception:
+        db_session.close()
+        raise
+    
+    def generate():
+        try:
+            for partial in user_research_agent.ask(
+                question=request.question,
+                per_sub_k=request.per_sub_k,
+                stream=True
+            ):
+                yield json.dumps(partial, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e), "done": True}) + "\n"
+        finally:
+            db_session.close()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @app.get("/export")
 async def export_report(question: str, current_user: TokenData = Depends(get_current_active_user)):
     """
@@ -503,6 +562,8 @@ async def upload_file(
             )
             
             if result["success"]:
+                # New documents can change answers to previously cached questions
+                research_cache.invalidate(current_user.user_id)
                 return FileUploadResponse(
                     success=True,
                     filename=file.filename,
@@ -731,7 +792,7 @@ async def chat_with_agent(
 [User question]:
 "{request.message}" """
         
-        response = user_chat_agent.process(
+        response = await user_chat_agent.aprocess(
             message=enhanced_message,
             conversation_id=request.conversation_id,
             per_sub_k=request.per_sub_k,
@@ -746,7 +807,7 @@ async def chat_with_agent(
             message_count=response.message_count,
             context_used=response.context_used,
             timestamp=response.timestamp,
-            research_result=response.research_result.to_dict() if response.research_result else None,
+            research_result=response.research_result_to_dict(),
             error=response.error
         )
         
@@ -766,10 +827,18 @@ async def chat_with_agent(
 
 @app.get("/conversations", response_model=List[ConversationInfo])
 async def list_conversations(
+    limit: Optional[int] = Query(None, ge=1),
+    before_updated_at: Optional[datetime] = None,
+    before_id: Optional[str] = None,
     current_user: TokenData = Depends(get_current_active_user)
 ):
     """
-    List all conversations for the current user (admin can see all).
+    List conversations for the current user (admin can see all), newest first.
+    
+    Args:
+        limit: Maximum number of conversations to return (all if omitted)
+        before_updated_at: updated_at of the last conversation of the previous page
+        before_id: ID of the last conversation of the previous page
     
     Returns:
         List of conversation information
@@ -780,7 +849,8 @@ async def list_conversations(
     try:
         db_session = SessionLocal()
         conversation_manager = get_conversation_manager_for_user(current_user, db_session)
-        conversations = conversation_manager.list_conversations()
+        before = (before_updated_at, before_id) if before_updated_at and before_id else None
+        conversations = conversation_manager.list_conversations(limit=limit, before=before)
         return [ConversationInfo(**conv) for conv in conversations]
     except Exception as e:
         raise HTTPException(
@@ -970,8 +1040,7 @@ async def get_follow_up_suggestions(
         db_session = SessionLocal()
         conversation_manager = get_conversation_manager_for_user(current_user, db_session)
         # Verify conversation exists and user has access
-        conversation = conversation_manager.get_conversation(conversation_id)
-        if not conversation:
+        if not conversation_manager.conversation_exists(conversation_id):
             raise HTTPException(
                 status_code=404,
                 detail="Conversation not found"
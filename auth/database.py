@@ -3,7 +3,7 @@ Database configuration and models for authentication
 """
 
 import os
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Boolean, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime, timezone
@@ -24,10 +24,26 @@ if not DATABASE_URL:
         "Please set it in your .env file or environment variables."
     )
 
+# HNSW candidate list size for vector searches; higher improves recall at some speed cost
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+
 # Create engine
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 engine = create_engine(DATABASE_URL, connect_args=connect_args)
 
+if engine.dialect.name == "postgresql":
+    @event.listens_for(engine, "connect")
+    def _set_vector_search_params(dbapi_connection, connection_record):
+        """Apply HNSW search settings once per pooled connection."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET hnsw.ef_search = %d" % HNSW_EF_SEARCH)
+        # Keep scanning the index past ef_search candidates when the user_id and
+        # threshold filters discard them, so small tenants still get k rows (pgvector 0.8+)
+        cursor.execute("SET hnsw.iterative_scan = relaxed_order")
+        cursor.close()
+        # Commit so the pool's rollback-on-return does not undo the setting
+        dbapi_connection.commit()
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -6,6 +6,7 @@ Replaces Chroma-based document processing with Postgres embedding storage.
 import os
 import uuid
 import logging
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 from sqlalchemy.orm import Session
@@ -91,6 +92,7 @@ def _get_or_create_document_system_conversation(db_session: Session, user_id: in
             message_metadata='{"source": "document_upload"}'
         )
         db_session.add(system_message)
+        system_conversation.updated_at = datetime.now(timezone.utc)
         db_session.commit()
         return system_conversation.id, message_id
     else:
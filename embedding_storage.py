@@ -57,6 +57,12 @@ def store_embedding(
         if np.any(np.isnan(vector_array)) or np.any(np.isinf(vector_array)):
             raise AgentError("Vector contains NaN or infinite values")
         
+        # Store unit vectors so inner product equals cosine similarity at search time
+        vector_norm = np.linalg.norm(vector_array)
+        if vector_norm == 0:
+            raise AgentError("Vector cannot be all zeros")
+        vector_array = vector_array / vector_norm
+        
         # Create embedding record
         embedding = EmbeddingDB(
             message_id=message_id,
@@ -119,34 +125,32 @@ def retrieve_similar_embeddings(
         # Normalize query vector for cosine similarity
         query_norm = query_array / vector_norm
         
-        # Convert query vector to PostgreSQL array format for vector operations
-        query_vector_array = f"[{','.join(map(str, query_vector))}]"
-        
-        # Use SQLAlchemy ORM with func for vector operations
-        # Note: We use the original query_vector (not normalized) for the database query
-        # as the database will handle the vector operations
+        # Stored vectors are unit length, so the negative inner product (<#>) orders
+        # exactly like cosine distance without per-row norms, and the HNSW index serves it
+        distance = EmbeddingDB.vector.max_inner_product(query_norm)
         query = db_session.query(
             EmbeddingDB.id,
             EmbeddingDB.message_id,
             EmbeddingDB.user_id,
             EmbeddingDB.embedding_metadata,
             EmbeddingDB.created_at,
-            (1 - func.cosine_distance(EmbeddingDB.vector, query_vector_array)).label('similarity_score')
+            (-distance).label('similarity_score')
         ).filter(
             and_(
                 EmbeddingDB.user_id == user_id,
-                func.cosine_distance(EmbeddingDB.vector, query_vector_array) <= (1 - similarity_threshold)
+                distance <= -similarity_threshold
             )
         ).order_by(
-            func.cosine_distance(EmbeddingDB.vector, query_vector_array)
+            distance
         ).limit(k)
         
         # Execute query
         result = query.all()
         
-        # Format results
+        # Format results; relaxed_order iterative index scans may return rows
+        # slightly out of distance order, so restore the order for the k rows
         embeddings = []
-        for row in result:
+        for row in sorted(result, key=lambda row: row.similarity_score, reverse=True):
             # The similarity threshold is already applied in the query filter
             # but we double-check here for safety
             if row.similarity_score >= similarity_threshold:
@@ -180,23 +184,19 @@ def get_embedding_stats(db_session: Session, user_id: Optional[int] = None) -> D
     """
     try:
         if user_id:
-            # Get stats for specific user using ORM
-            total_embeddings = db_session.query(EmbeddingDB).filter(EmbeddingDB.user_id == user_id).count()
-            
-            # Get unique messages count using ORM
-            unique_messages = db_session.query(EmbeddingDB.message_id).filter(
-                EmbeddingDB.user_id == user_id
-            ).distinct().count()
+            # Get total and unique message counts for a specific user in one aggregate query
+            total_embeddings, unique_messages = db_session.query(
+                func.count(EmbeddingDB.id),
+                func.count(EmbeddingDB.message_id.distinct())
+            ).filter(EmbeddingDB.user_id == user_id).one()
             
         else:
-            # Get stats for all users using ORM
-            total_embeddings = db_session.query(EmbeddingDB).count()
-            
-            # Get unique messages count using ORM
-            unique_messages = db_session.query(EmbeddingDB.message_id).distinct().count()
-            
-            # Get unique users count using ORM
-            unique_users = db_session.query(EmbeddingDB.user_id).distinct().count()
+            # Get total, unique message and unique user counts for all users in one query
+            total_embeddings, unique_messages, unique_users = db_session.query(
+                func.count(EmbeddingDB.id),
+                func.count(EmbeddingDB.message_id.distinct()),
+                func.count(EmbeddingDB.user_id.distinct())
+            ).one()
         
         stats = {
             "total_embeddings": total_embeddings,
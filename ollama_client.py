@@ -1,9 +1,57 @@
 import ollama
+import httpx
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 import json
 
 
+# Connection pool limits for the HTTP client shared by all OllamaClient instances
+OLLAMA_POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=8)
+
+# One keep-alive ollama.Client per host, reused across per-request OllamaClient instances
+_shared_clients: Dict[str, ollama.Client] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(base_url: str) -> ollama.Client:
+    """
+    Get the pooled Ollama client for a host, creating it on first use.
+    
+    Args:
+        base_url: Base URL for Ollama API
+        
+    Returns:
+        ollama.Client whose connections are kept alive between calls
+    """
+    with _shared_clients_lock:
+        client = _shared_clients.get(base_url)
+        if client is None:
+            client = ollama.Client(host=base_url, limits=OLLAMA_POOL_LIMITS)
+            _shared_clients[base_url] = client
+        return client
+
+
+# Seconds an availability probe is trusted before Ollama is asked again
+AVAILABILITY_TTL_SECONDS = 30.0
+
+# Last probe per (base_url, requested model): (monotonic time, available, resolved model name)
+_availability: Dict[Tuple[str, str], Tuple[float, bool, str]] = {}
+_availability_lock = threading.Lock()
+
+
+def close_shared_clients() -> None:
+    """Close all pooled Ollama connections."""
+    with _shared_clients_lock:
+        for client in _shared_clients.values():
+            # ollama.Client keeps its httpx.Client privately; skip closing if that changes
+            http_client = getattr(client, "_client", None)
+            if http_client is not None:
+                http_client.close()
+        _shared_clients.clear()
+
+
 class OllamaClient:
     """
     Client for interacting with local Ollama models.
@@ -19,14 +67,14 @@ class OllamaClient:
         """
         self.model_name = model_name
         self.base_url = base_url
-        self.client = ollama.Client(host=base_url)
+        self.client = get_shared_client(base_url)
+        self._requested_model = model_name
         
-        # Test connection
-        try:
-            self._test_connection()
-            logging.info(f"Ollama client initialized with model: {model_name}")
-        except Exception as e:
-            logging.warning(f"Could not connect to Ollama at {base_url}: {e}")
+        # Test connection (shared with later is_available calls within the TTL)
+        if self.is_available():
+            logging.info(f"Ollama client initialized with model: {self.model_name}")
+        else:
+            logging.warning(f"Could not connect to Ollama at {base_url}")
             logging.warning("Make sure Ollama is running and the model is available")
     
     def _test_connection(self):
@@ -51,7 +99,8 @@ class OllamaClient:
             except Exception as e2:
                 raise Exception(f"Failed to connect to Ollama: {e2}")
     
-    def generate_text(self, prompt: str, system_prompt: str = None, max_tokens: int = 1000) -> str:
+    def generate_text(self, prompt: str, system_prompt: str = None, max_tokens: int = 1000,
+                      response_format: Optional[str] = None) -> str:
         """
         Generate text using Ollama model.
         
@@ -59,6 +108,7 @@ class OllamaClient:
             prompt: User prompt
             system_prompt: System prompt for context
             max_tokens: Maximum tokens to generate
+            response_format: Optional Ollama output format (e.g. "json")
             
         Returns:
             Generated text
@@ -69,6 +119,10 @@ class OllamaClient:
                 messages.append({"role": "system", "content": system_prompt})
             messages.append({"role": "user", "content": prompt})
             
+            chat_kwargs = {}
+            if response_format:
+                chat_kwargs["format"] = response_format
+            
             response = self.client.chat(
                 model=self.model_name,
                 messages=messages,
@@ -76,7 +130,8 @@ class OllamaClient:
                     "num_predict": max_tokens,
                     "temperature": 0.7,
                     "top_p": 0.9
-                }
+                },
+                **chat_kwargs
             )
             
             return response['message']['content'].strip()
@@ -85,6 +140,45 @@ class OllamaClient:
             logging.error(f"Error generating text: {e}")
             return f"Error: Could not generate text - {e}"
     
+    def generate_text_stream(self, prompt: str, system_prompt: str = None,
+                             max_tokens: int = 1000) -> Iterator[str]:
+        """
+        Generate text using Ollama model, yielding tokens as they arrive.
+        
+        Args:
+            prompt: User prompt
+            system_prompt: System prompt for context
+            max_tokens: Maximum tokens to generate
+            
+        Yields:
+            Generated text fragments
+        """
+        try:
+            messages = []
+            if system_prompt:
+                messages.append({"role": "system", "content": system_prompt})
+            messages.append({"role": "user", "content": prompt})
+            
+            stream = self.client.chat(
+                model=self.model_name,
+                messages=messages,
+                options={
+                    "num_predict": max_tokens,
+                    "temperature": 0.7,
+                    "top_p": 0.9
+                },
+                stream=True
+            )
+            
+            for chunk in stream:
+                content = chunk['message']['content']
+                if content:
+                    yield content
+                    
+        except Exception as e:
+            logging.error(f"Error streaming text: {e}")
+            yield f"Error: Could not generate text - {e}"
+    
     def generate_subqueries(self, question: str) -> List[str]:
         """
         Generate subqueries for a research question using LLM.
@@ -139,15 +233,62 @@ class OllamaClient:
         Synthesize information from multiple documents into a coherent summary.
         Be concise but comprehensive. Use information from the documents provided."""
         
+        documents_text = "\n".join(doc_texts)
         prompt = f"""Question: {subquery}
 
 Documents to summarize:
-{chr(10).join(doc_texts)}
+{documents_text}
 
 Provide a focused summary that answers the question:"""
         
         return self.generate_text(prompt, system_prompt, max_tokens=800)
     
+    def summarize_batch(self, subqueries: List[str], docs_per_sq: List[List[Dict[str, Any]]]) -> Dict[str, str]:
+        """
+        Summarize the documents of several subqueries in a single LLM call.
+        
+        Args:
+            subqueries: Subqueries being addressed
+            docs_per_sq: Retrieved documents for each subquery
+            
+        Returns:
+            Dictionary mapping the subquery index (as a string) to its summary.
+            Entries are missing if the model output could not be parsed.
+        """
+        sections = []
+        for index, (subquery, documents) in enumerate(zip(subqueries, docs_per_sq)):
+            doc_texts = []
+            for i, doc in enumerate(documents, 1):
+                doc_texts.append(f"Document {i}: {doc.get('title', 'Unknown')}\n{doc.get('full_text', '')[:1000]}...")
+            sections.append(f"[{index}] Question: {subquery}\n" + "\n".join(doc_texts))
+        
+        system_prompt = """You are a research assistant that summarizes documents to answer specific questions.
+        You will receive several numbered questions, each with its own documents.
+        For each question, write a focused summary using only the documents given for that question.
+        Respond with a JSON object mapping each question number to its summary, e.g. {"0": "...", "1": "..."}."""
+        
+        sections_text = "\n".join(sections)
+        prompt = f"""Questions and documents to summarize:
+
+{sections_text}
+
+Return the JSON object of summaries:"""
+        
+        response = self.generate_text(prompt, system_prompt, max_tokens=800 * len(subqueries),
+                                      response_format="json")
+        
+        try:
+            parsed = json.loads(response)
+        except (json.JSONDecodeError, TypeError):
+            logging.warning("Could not parse batched summaries from Ollama response")
+            return {}
+        
+        if not isinstance(parsed, dict):
+            return {}
+        
+        return {str(key): value.strip() for key, value in parsed.items()
+                if isinstance(value, str) and value.strip()}
+    
     def synthesize_answer(self, question: str, subquery_results: List[Dict[str, Any]]) -> str:
         """
         Synthesize final answer from subquery results using LLM.
@@ -171,10 +312,11 @@ Provide a focused summary that answers the question:"""
         Structure your answer clearly and provide a coherent narrative.
         Be thorough but concise."""
         
+        findings = "\n".join(subquery_texts)
         prompt = f"""Main Question: {question}
 
 Research Findings:
-{chr(10).join(subquery_texts)}
+{findings}
 
 Provide a comprehensive answer that synthesizes all the research findings:"""
         
@@ -198,17 +340,37 @@ Provide a comprehensive answer that synthesizes all the research findings:"""
         
         return self.generate_text(prompt, system_prompt, max_tokens=300)
     
-    def is_available(self) -> bool:
+    def is_available(self, force: bool = False) -> bool:
         """
         Check if Ollama is available and working.
         
+        Probe results are shared by clients for the same host and model for
+        AVAILABILITY_TTL_SECONDS, so building per-request agents does not
+        re-probe Ollama each time.
+        
+        Args:
+            force: Probe Ollama even if a recent result is cached
+        
         Returns:
             True if Ollama is available, False otherwise
         """
+        key = (self.base_url, self._requested_model)
+        if not force:
+            with _availability_lock:
+                cached = _availability.get(key)
+            if cached is not None and time.monotonic() - cached[0] < AVAILABILITY_TTL_SECONDS:
+                _, available, self.model_name = cached
+                return available
+        
         try:
             self._test_connection()
-            return True
-        except Exception:
-            return False
+            available = True
+        except Exception as e:
+            logging.debug(f"Ollama availability check failed: {e}")
+            available = False
+        
+        with _availability_lock:
+            _availability[key] = (time.monotonic(), available, self.model_name)
+        return available
 
 
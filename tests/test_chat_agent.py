@@ -3,9 +3,11 @@ Tests for chat agent components.
 """
 
 import pytest
+import uuid
 from unittest.mock import Mock, patch
 from datetime import datetime
 from agents.chat import ChatAgent, ConversationManager, ContextBuilder, ResponseGenerator
+from agents.chat import context_builder
 from agents.shared.models import ResearchResult, SubqueryResult, ChatMessage, Conversation, ChatResponse
 from agents.shared.exceptions import AgentError, ConversationError
 
@@ -144,6 +146,56 @@ class TestContextBuilder:
         assert context['message_count'] == 3
         assert 'machine learning' in context['recent_context'].lower()
     
+    def test_build_research_context_cached_per_revision(self, sample_conversation):
+        """Test the context is reused until the conversation changes."""
+        builder = ContextBuilder()
+        
+        with patch.object(ContextBuilder, '_build_research_context', autospec=True,
+                          side_effect=ContextBuilder._build_research_context) as build:
+            first = builder.build_research_context(sample_conversation)
+            second = ContextBuilder().build_research_context(sample_conversation)
+            assert build.call_count == 1
+            
+            sample_conversation.add_message("assistant", "Deep learning uses neural networks.")
+            third = builder.build_research_context(sample_conversation)
+        
+        assert second == first
+        assert second is not first
+        assert third['message_count'] == 4
+        assert build.call_count == 2
+    
+    def test_build_research_context_without_messages(self, sample_conversation):
+        """Test recent messages are only serialized when requested."""
+        builder = ContextBuilder()
+        
+        with patch.object(ChatMessage, 'to_dict', autospec=True, side_effect=ChatMessage.to_dict) as to_dict:
+            context = builder.build_research_context(sample_conversation, include_messages=False)
+        
+        to_dict.assert_not_called()
+        assert 'recent_messages' not in context
+        assert context['recent_messages_count'] == 3
+        assert 'machine learning' in context['recent_context'].lower()
+    
+    def test_build_research_context_reuses_message_fragments(self, sample_conversation, sample_research_result):
+        """Test message fragments are cached by message ID for later turns."""
+        builder = ContextBuilder(max_context_messages=3)
+        sample_conversation.add_message(
+            "assistant", "Answer", metadata={"research_result": sample_research_result.to_dict()}
+        )
+        builder.build_research_context(sample_conversation)
+        
+        assert all(msg.id in context_builder._fragment_cache for msg in sample_conversation.messages[-3:])
+        
+        sample_conversation.add_message("user", "Tell me about deep learning")
+        context = builder.build_research_context(sample_conversation)
+        
+        assert context['recent_context'] == (
+            "Previous question: How does it work? "
+            "Previously researched: What is machine learning?; How does machine learning work? "
+            "Previous question: Tell me about deep learning"
+        )
+        assert context['research_topics'] == ["What is machine learning?", "How does machine learning work?"]
+    
     def test_enhance_question_with_context(self):
         """Test enhancing question with context."""
         builder = ContextBuilder()
@@ -182,6 +234,19 @@ class TestContextBuilder:
         assert "What is machine learning?" in topics
         assert "How does deep learning work?" in topics
     
+    def test_extract_research_topics_deduplicates_in_order(self, sample_conversation):
+        """Test repeated subqueries are kept once, in first-seen order."""
+        builder = ContextBuilder()
+        
+        sample_conversation.add_message("assistant", "Response 1",
+                                       metadata={"research_result": {"subqueries": [{"subquery": "B"}, {"subquery": "A"}]}})
+        sample_conversation.add_message("assistant", "Response 2",
+                                       metadata={"research_result": {"answer": "No subqueries"}})
+        sample_conversation.add_message("assistant", "Response 3",
+                                       metadata={"research_result": {"subqueries": [{"subquery": "A"}, {"subquery": "C"}]}})
+        
+        assert builder.extract_research_topics(sample_conversation) == ["B", "A", "C"]
+    
     def test_get_conversation_theme(self, sample_conversation):
         """Test getting conversation theme."""
         builder = ContextBuilder()
@@ -189,6 +254,37 @@ class TestContextBuilder:
         theme = builder.get_conversation_theme(sample_conversation)
         
         assert theme == "machine learning"
+    
+    def test_get_conversation_theme_whole_words(self):
+        """Test theme keywords match whole words and map aliases to labels."""
+        builder = ContextBuilder()
+        conversation = Conversation(
+            id="theme-conv", title="Theme", created_at=datetime.now(),
+            updated_at=datetime.now(), messages=[], context={}
+        )
+        conversation.add_message("user", "How do I style HTML emails?")
+        
+        assert builder.get_conversation_theme(conversation) == "General conversation"
+        
+        conversation.add_message("user", "Is AI useful for that?")
+        conversation.add_message("user", "Which AI tools write code?")
+        
+        assert builder.get_conversation_theme(conversation) == "artificial intelligence"
+    
+    def test_get_conversation_theme_cached(self, sample_conversation):
+        """Test the theme is reused until a new leading user message arrives."""
+        builder = ContextBuilder()
+        builder.get_conversation_theme(sample_conversation)
+        
+        with patch.object(builder, '_extract_theme', wraps=builder._extract_theme) as extract:
+            builder.get_conversation_theme(sample_conversation)
+            sample_conversation.add_message("assistant", "More details about the topic")
+            builder.get_conversation_theme(sample_conversation)
+            extract.assert_not_called()
+            
+            sample_conversation.add_message("user", "What about data science?")
+            builder.get_conversation_theme(sample_conversation)
+            extract.assert_called_once()
 
 
 class TestResponseGenerator:
@@ -246,6 +342,24 @@ class TestResponseGenerator:
         assert len(suggestions) > 0
         assert any("machine learning" in s.lower() for s in suggestions)
     
+    def test_follow_up_suggestions_match_topics_within_subqueries(self):
+        """Test topic rules fire on subquery words but phrases never span subqueries."""
+        generator = ResponseGenerator()
+        
+        def result_for(*subqueries):
+            return ResearchResult(
+                question="q", answer="a",
+                subqueries=[SubqueryResult(subquery=sq, summary="s", documents=[], success=True)
+                            for sq in subqueries],
+                citations=[], total_documents=0, processing_time=0.0
+            )
+        
+        data_science = generator.generate_follow_up_suggestions(result_for("data science tools"))
+        assert data_science[0] == "What tools are commonly used in data science?"
+        
+        split_phrase = generator.generate_follow_up_suggestions(result_for("tell about machine", "learning rate"))
+        assert split_phrase[0] == "Can you provide more details about this topic?"
+    
     def test_format_citations(self):
         """Test formatting citations."""
         generator = ResponseGenerator()
@@ -455,4 +569,169 @@ class TestChatAgent:
         
         assert result == True
         conversation_manager.update_conversation_title.assert_called_once_with(conv_id, "New Title")
-
+    
+    def test_generate_follow_up_suggestions(self, sample_research_result):
+        """Test follow-up suggestions come from the tracked research message."""
+        conversation_manager = Mock()
+        conversation_manager.get_last_research_message.return_value = ChatMessage(
+            id="msg-1",
+            role="assistant",
+            content="Answer",
+            timestamp=datetime.now(),
+            metadata={"research_result": sample_research_result.to_dict()}
+        )
+        chat_agent = ChatAgent(Mock(), conversation_manager)
+        
+        suggestions = chat_agent.generate_follow_up_suggestions("conv-1")
+        
+        assert any("machine learning" in s.lower() for s in suggestions)
+        conversation_manager.get_last_research_message.assert_called_once_with("conv-1")
+        conversation_manager.get_conversation.assert_not_called()
+    
+    def test_process_stores_research_result_once(self, sample_conversation, sample_research_result):
+        """Test the assistant message metadata does not duplicate the subqueries."""
+        conversation_manager = Mock()
+        conversation_manager.get_conversation.return_value = sample_conversation
+        conversation_manager.add_message.side_effect = lambda conv_id, role, content, metadata=None, title=None: ChatMessage(
+            id=f"{role}-msg", role=role, content=content, timestamp=datetime.now(), metadata=metadata
+        )
+        research_agent = Mock()
+        research_agent.process.return_value = sample_research_result
+        chat_agent = ChatAgent(research_agent, conversation_manager)
+        
+        response = chat_agent.process("Tell me more", conversation_id="test-conv-1")
+        
+        metadata = conversation_manager.add_message.call_args_list[-1].kwargs["metadata"]
+        assert response.message_id == "assistant-msg"
+        assert "subqueries" not in metadata
+        assert len(metadata["research_result"]["subqueries"]) == 2
+        assert response.research_result_to_dict() is metadata["research_result"]
+        assert metadata["citations_count"] == 1
+    
+    def test_process_saves_generated_title_with_user_message(self, sample_conversation, sample_research_result):
+        """Test a generated title is written with the user message instead of a separate update."""
+        sample_conversation.title = "New Chat"
+        conversation_manager = Mock()
+        conversation_manager.get_conversation.return_value = sample_conversation
+        research_agent = Mock()
+        research_agent.process.return_value = sample_research_result
+        chat_agent = ChatAgent(research_agent, conversation_manager)
+        
+        chat_agent.process("Tell me more", conversation_id="test-conv-1")
+        
+        user_call = conversation_manager.add_message.call_args_list[0]
+        assert user_call.kwargs["title"] == sample_conversation.title
+        assert sample_conversation.title != "New Chat"
+        conversation_manager.update_conversation_title.assert_not_called()
+    
+    def test_process_error_metadata_is_serializable(self, sample_conversation):
+        """Test research errors are stored as plain strings in the message metadata."""
+        conversation_manager = Mock()
+        conversation_manager.get_conversation.return_value = sample_conversation
+        research_agent = Mock()
+        research_agent.process.side_effect = ValueError("Research error")
+        chat_agent = ChatAgent(research_agent, conversation_manager)
+        
+        response = chat_agent.process("Tell me more", conversation_id="test-conv-1")
+        
+        metadata = conversation_manager.add_message.call_args_list[-1].kwargs["metadata"]
+        assert metadata == {"error": "Research error", "error_type": "ValueError"}
+        assert response.error == "Research error"
+    
+    def test_process_failure_chains_original_error(self):
+        """Test unexpected failures are wrapped in AgentError with the original cause."""
+        conversation_manager = Mock()
+        conversation_manager.get_conversation.side_effect = RuntimeError("Database down")
+        chat_agent = ChatAgent(Mock(), conversation_manager)
+        
+        with pytest.raises(AgentError) as exc_info:
+            chat_agent.process("Hello", conversation_id="test-conv-1")
+        
+        assert isinstance(exc_info.value.__cause__, RuntimeError)
+    
+    def test_generate_conversation_title_truncates(self):
+        """Test generated titles are capped at 30 characters with an ellipsis."""
+        chat_agent = ChatAgent(Mock(), Mock())
+        
+        assert chat_agent._generate_conversation_title("  Short message  ") == "Short message"
+        
+        title = chat_agent._generate_conversation_title("Please summarise everything about the history of computing")
+        assert title == "Please summarise everything..."
+        assert len(title) == 30
+    
+    def test_generate_conversation_title_strips_question_words(self):
+        """Test leading question words are dropped from question titles."""
+        chat_agent = ChatAgent(Mock(), Mock())
+        
+        title = chat_agent._generate_conversation_title("What is the best way to learn SQL?")
+        assert title == "Is the best way to learn sql?"
+        
+        title = chat_agent._generate_conversation_title("How could I index a very large table quickly?")
+        assert title == "i index a very large table ..."
+        
+        # 'Whatever' is not a question word
+        title = chat_agent._generate_conversation_title("Whatever happened to the old index advisor?")
+        assert title == "whatever happened to the ol..."
+    
+    def test_generate_conversation_title_from_keyword(self):
+        """Test titles are built around the first whole-word important keyword."""
+        chat_agent = ChatAgent(Mock(), Mock())
+        
+        title = chat_agent._generate_conversation_title("Explain to me, briefly, everything about SQL indexes")
+        assert title == "ing about SQL indexes"
+        
+        # 'ai' inside 'explain' is not a keyword match
+        title = chat_agent._generate_conversation_title("Please explain the contents of this long report")
+        assert title == "Please explain the contents..."
+    
+    def test_is_generic_title(self):
+        """Test placeholder titles are detected."""
+        chat_agent = ChatAgent(Mock(), Mock())
+        
+        assert chat_agent._is_generic_title("  New Chat ")
+        assert chat_agent._is_generic_title("Hi")
+        assert not chat_agent._is_generic_title("Machine learning basics")
+    
+    def test_follow_up_suggestions_reuse_research_result(self, sample_conversation, sample_research_result):
+        """Test follow-ups for a just-answered message skip rebuilding the research result."""
+        messages = {}
+        
+        def add_message(conv_id, role, content, metadata=None, title=None):
+            message = ChatMessage(id=str(uuid.uuid4()), role=role, content=content,
+                                  timestamp=datetime.now(), metadata=metadata)
+            messages[role] = message
+            return message
+        
+        conversation_manager = Mock()
+        conversation_manager.get_conversation.return_value = sample_conversation
+        conversation_manager.add_message.side_effect = add_message
+        conversation_manager.get_last_research_message.side_effect = lambda conv_id: messages["assistant"]
+        research_agent = Mock()
+        research_agent.process.return_value = sample_research_result
+        chat_agent = ChatAgent(research_agent, conversation_manager)
+        
+        chat_agent.process("Tell me more", conversation_id="test-conv-1")
+        with patch.object(ResearchResult, 'from_dict') as from_dict:
+            suggestions = chat_agent.generate_follow_up_suggestions("test-conv-1")
+        
+        from_dict.assert_not_called()
+        assert any("machine learning" in s.lower() for s in suggestions)
+    
+    def test_aprocess_runs_process_in_worker_thread(self):
+        """Test the async variant delegates to process off the event loop thread."""
+        import asyncio
+        import threading
+        
+        chat_agent = ChatAgent(Mock(), Mock())
+        calls = []
+        
+        def process(message, conversation_id, per_sub_k, include_context):
+            calls.append((message, conversation_id, per_sub_k, include_context, threading.get_ident()))
+            return "response"
+        
+        with patch.object(chat_agent, 'process', side_effect=process):
+            result = asyncio.run(chat_agent.aprocess("Hello", "conv-1", per_sub_k=2))
+        
+        assert result == "response"
+        assert calls[0][:4] == ("Hello", "conv-1", 2, True)
+        assert calls[0][4] != threading.get_ident()
@@ -5,6 +5,7 @@ Tests for database-based ConversationManager with user isolation.
 import pytest
 import uuid
 from datetime import datetime
+from unittest.mock import patch
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
@@ -154,6 +155,52 @@ class TestConversationManagerDB:
         assert len(user3_conversations) == 1
         assert user3_conversations[0]["id"] == conv3_id
     
+    def test_list_conversations_counts_messages_in_one_query(self, db_session, conversation_manager_user1):
+        """Test message counts are returned without a query per conversation."""
+        from sqlalchemy import event
+        
+        busy_id = conversation_manager_user1.create_conversation("Busy")
+        conversation_manager_user1.add_message(busy_id, "user", "One")
+        conversation_manager_user1.add_message(busy_id, "assistant", "Two")
+        empty_id = conversation_manager_user1.create_conversation("Empty")
+        
+        statements = []
+        engine = db_session.get_bind()
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            conversations = conversation_manager_user1.list_conversations()
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        
+        counts = {conv['id']: conv['message_count'] for conv in conversations}
+        assert counts == {busy_id: 2, empty_id: 0}
+        assert len(statements) == 1
+    
+    def test_list_conversations_keyset_pages(self, db_session, conversation_manager_user1):
+        """Test paging through conversations with an (updated_at, id) cursor."""
+        conv_ids = [conversation_manager_user1.create_conversation(f"Conversation {i}") for i in range(5)]
+        
+        # Two conversations share an updated_at, so the ID breaks the tie
+        tied_at = datetime(2024, 1, 1, 12, 0, 0)
+        for conv_db in db_session.query(ConversationDB).filter(ConversationDB.id.in_(conv_ids[:2])):
+            conv_db.updated_at = tied_at
+        db_session.commit()
+        
+        expected = [conv['id'] for conv in conversation_manager_user1.list_conversations()]
+        
+        pages, before = [], None
+        while True:
+            page = conversation_manager_user1.list_conversations(limit=2, before=before)
+            if not page:
+                break
+            pages.append([conv['id'] for conv in page])
+            before = (datetime.fromisoformat(page[-1]['updated_at']), page[-1]['id'])
+        
+        assert [len(page) for page in pages] == [2, 2, 1]
+        assert [conv_id for page in pages for conv_id in page] == expected
+        assert sorted(expected) == sorted(conv_ids)
+    
     def test_admin_can_see_all_conversations(self, conversation_manager_user1, conversation_manager_user3, conversation_manager_admin):
         """Test that admin can see all conversations."""
         # User1 creates conversations
@@ -183,6 +230,165 @@ class TestConversationManagerDB:
         message2 = conversation_manager_user3.add_message(conv_id, "user", "Hello from User3")
         assert message2 is None  # Should not be able to add message
     
+    def test_add_message_updates_title(self, conversation_manager_user1):
+        """Test a title passed with a message is saved alongside it."""
+        conv_id = conversation_manager_user1.create_conversation("New Chat")
+        
+        message = conversation_manager_user1.add_message(conv_id, "user", "Explain SQL indexes", title="SQL indexes")
+        assert message is not None
+        
+        conversation = conversation_manager_user1.get_conversation(conv_id)
+        assert conversation.title == "SQL indexes"
+        assert len(conversation.messages) == 1
+    
+    def test_add_message_does_not_load_history(self, conversation_manager_user1):
+        """Test adding a message checks access without loading the whole conversation."""
+        conv_id = conversation_manager_user1.create_conversation("History Check")
+        
+        with patch.object(conversation_manager_user1, '_db_to_conversation') as to_conversation:
+            assert conversation_manager_user1.add_message(conv_id, "user", "Hello") is not None
+            assert conversation_manager_user1.update_conversation_title(conv_id, "Renamed") is True
+            assert len(conversation_manager_user1.get_conversation_history(conv_id)) == 1
+        
+        to_conversation.assert_not_called()
+    
+    def test_create_conversation_without_refresh(self, db_session, conversation_manager_user1):
+        """Test creating a conversation does not read the new row back."""
+        from sqlalchemy import event
+        
+        statements = []
+        engine = db_session.get_bind()
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            conv_id = conversation_manager_user1.create_conversation("Fresh")
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        
+        assert [s.split()[0] for s in statements] == ["INSERT"]
+        assert conversation_manager_user1.active_conversation_id == conv_id
+        assert conversation_manager_user1.get_conversation(conv_id).title == "Fresh"
+    
+    def test_add_message_returns_stored_message_without_refresh(self, db_session, conversation_manager_user1):
+        """Test the returned message matches the stored row without reloading it."""
+        conv_id = conversation_manager_user1.create_conversation("Refresh")
+        
+        with patch.object(db_session, 'refresh') as refresh:
+            message = conversation_manager_user1.add_message(conv_id, "assistant", "Answer",
+                                                             metadata={"citations_count": 2})
+        
+        refresh.assert_not_called()
+        stored = conversation_manager_user1.get_conversation_history(conv_id)[0]
+        assert message == stored
+        assert message.metadata == {"citations_count": 2}
+    
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_metadata_serialization(self, monkeypatch, use_orjson):
+        """Test metadata round-trips with and without the optional orjson encoder."""
+        from agents.chat import conversation_manager as manager_module
+        if not use_orjson:
+            monkeypatch.setattr(manager_module, "orjson", None)
+        
+        metadata = {"research_result": {"answer": "Résumé", "citations": [{"score": 0.5}]}}
+        raw = ConversationManager._dump_metadata(metadata)
+        assert ConversationManager._parse_metadata(raw) == metadata
+        
+        # Non-string keys and NaN written by the stdlib encoder are still handled
+        assert ConversationManager._parse_metadata(ConversationManager._dump_metadata({1: "a"})) == {"1": "a"}
+        parsed = ConversationManager._parse_metadata('{"score": NaN}')
+        assert parsed["score"] != parsed["score"]
+        assert ConversationManager._parse_metadata("not json") == {}
+    
+    def test_get_conversation_reuses_decoded_messages(self, conversation_manager_user1):
+        """Test unchanged conversations are served without re-reading their messages."""
+        conv_id = conversation_manager_user1.create_conversation("Cached")
+        conversation_manager_user1.add_message(conv_id, "user", "First")
+        conversation_manager_user1.get_conversation(conv_id)
+        
+        with patch.object(conversation_manager_user1, '_db_to_message',
+                          wraps=conversation_manager_user1._db_to_message) as to_message:
+            first = conversation_manager_user1.get_conversation(conv_id)
+            second = conversation_manager_user1.get_conversation(conv_id)
+            to_message.assert_not_called()
+            
+            # A new message bumps updated_at and invalidates the cached messages
+            conversation_manager_user1.add_message(conv_id, "assistant", "Second")
+            to_message.reset_mock()
+            third = conversation_manager_user1.get_conversation(conv_id)
+            assert to_message.call_count == 2
+        
+        assert [m.content for m in first.messages] == ["First"]
+        assert first.messages is not second.messages
+        assert [m.content for m in third.messages] == ["First", "Second"]
+    
+    def test_history_served_from_cached_messages(self, conversation_manager_user1):
+        """Test history reuses messages already decoded for an unchanged conversation."""
+        conv_id = conversation_manager_user1.create_conversation("History")
+        for i in range(4):
+            conversation_manager_user1.add_message(conv_id, "user", f"Message {i}")
+        
+        uncached = [m.content for m in conversation_manager_user1.get_conversation_history(conv_id, 3)]
+        conversation_manager_user1.get_conversation(conv_id)
+        
+        with patch.object(conversation_manager_user1, '_db_to_message') as to_message:
+            cached = [m.content for m in conversation_manager_user1.get_conversation_history(conv_id, 3)]
+            assert conversation_manager_user1.get_conversation_history(conv_id, 0) == []
+        
+        to_message.assert_not_called()
+        assert cached == uncached == ["Message 1", "Message 2", "Message 3"]
+    
+    def test_cached_conversation_respects_access(self, conversation_manager_user1, conversation_manager_user3):
+        """Test a cached conversation is still hidden from other users."""
+        conv_id = conversation_manager_user1.create_conversation("Private")
+        conversation_manager_user1.add_message(conv_id, "user", "Secret")
+        assert conversation_manager_user1.get_conversation(conv_id) is not None
+        
+        assert conversation_manager_user3.get_conversation(conv_id) is None
+    
+    def test_get_conversation_context_loads_conversation_once(self, conversation_manager_user1, conversation_manager_user3):
+        """Test the research context is built from a single conversation load."""
+        conv_id = conversation_manager_user1.create_conversation("Context")
+        for i in range(12):
+            conversation_manager_user1.add_message(conv_id, "user", f"Message {i}")
+        
+        with patch.object(conversation_manager_user1, '_get_conversation_db',
+                          wraps=conversation_manager_user1._get_conversation_db) as get_row:
+            context = conversation_manager_user1.get_conversation_context(conv_id)
+            assert conversation_manager_user1.set_active_conversation(conv_id) is True
+        
+        assert get_row.call_count == 2
+        assert [m['content'] for m in context['recent_messages']] == [f"Message {i}" for i in range(2, 12)]
+        assert context['message_count'] == 10
+        assert conversation_manager_user3.get_conversation_context(conv_id) == {}
+        assert conversation_manager_user3.set_active_conversation(conv_id) is False
+    
+    def test_conversation_exists_checks_access_only(self, conversation_manager_user1, conversation_manager_user3):
+        """Test existence checks respect access and skip loading messages."""
+        conv_id = conversation_manager_user1.create_conversation("Exists")
+        conversation_manager_user1.add_message(conv_id, "user", "Hello")
+        
+        with patch.object(conversation_manager_user1, '_db_to_conversation') as to_conversation:
+            assert conversation_manager_user1.conversation_exists(conv_id) is True
+        
+        to_conversation.assert_not_called()
+        assert conversation_manager_user3.conversation_exists(conv_id) is False
+        assert conversation_manager_user1.conversation_exists("not-a-uuid") is False
+        assert conversation_manager_user1.conversation_exists(str(uuid.uuid4())) is False
+    
+    def test_conversation_ids_are_matched_in_canonical_form(self, conversation_manager_user1, conversation_manager_user3):
+        """Test non-canonical spellings of a conversation ID resolve to the stored conversation."""
+        conv_id = conversation_manager_user1.create_conversation("Canonical")
+        conversation_manager_user1.add_message(conv_id, "user", "Hello")
+        
+        for spelling in (conv_id.upper(), "{" + conv_id + "}", conv_id.replace("-", "")):
+            conversation = conversation_manager_user1.get_conversation(spelling)
+            assert conversation is not None and conversation.id == conv_id
+            assert [m.content for m in conversation_manager_user1.get_conversation_history(spelling)] == ["Hello"]
+        
+        assert conversation_manager_user3.get_conversation(conv_id.upper()) is None
+        assert conversation_manager_user1.delete_conversation(conv_id.upper()) is True
+        assert conversation_manager_user1.get_conversation(conv_id) is None
+    
     def test_update_conversation_title_user_isolation(self, conversation_manager_user1, conversation_manager_user3):
         """Test that users can only update their own conversation titles."""
         # User1 creates a conversation
@@ -287,6 +493,27 @@ class TestConversationManagerDB:
         assert len(history) == 1
         assert history[0].metadata == metadata
     
+    def test_get_last_research_message(self, conversation_manager_user1, conversation_manager_user3):
+        """Test that the latest research message is tracked without scanning history."""
+        conv_id = conversation_manager_user1.create_conversation("Test Conversation")
+        conversation_manager_user1.add_message(conv_id, "user", "First question")
+        conversation_manager_user1.add_message(
+            conv_id, "assistant", "First answer", {"research_result": {"question": "first"}}
+        )
+        latest = conversation_manager_user1.add_message(
+            conv_id, "assistant", "Second answer", {"research_result": {"question": "second"}}
+        )
+        conversation_manager_user1.add_message(conv_id, "user", "Follow-up")
+        
+        message = conversation_manager_user1.get_last_research_message(conv_id)
+        
+        assert message is not None
+        assert message.id == latest.id
+        assert message.metadata["research_result"]["question"] == "second"
+        
+        # Other users cannot read the research message
+        assert conversation_manager_user3.get_last_research_message(conv_id) is None
+    
     def test_conversation_cascade_delete(self, db_session, conversation_manager_user1):
         """Test that deleting a conversation also deletes its messages."""
         # Create conversation and add messages
@@ -329,6 +556,26 @@ class TestConversationManagerDB:
         conversation = conversation_manager_user1.get_conversation(conv_id)
         assert conversation.context.get("highlights") == ["Important fact", "Second note"]
 
+    def test_metadata_writes_lock_conversation_row(self, db_session, conversation_manager_user1):
+        """Test read-modify-write of conversation metadata locks the row."""
+        from sqlalchemy.sql import Select
+        
+        conv_id = conversation_manager_user1.create_conversation("Locking")
+        
+        with patch.object(Select, 'with_for_update', autospec=True,
+                          side_effect=lambda statement, *args, **kwargs: statement) as with_for_update:
+            conversation_manager_user1.add_message(conv_id, "user", "Question")
+            assert with_for_update.call_count == 0
+            
+            conversation_manager_user1.add_message(conv_id, "assistant", "Answer",
+                                                   metadata={"research_result": {"answer": "Answer"}})
+            conversation_manager_user1.add_highlight(conv_id, "Key point")
+            assert with_for_update.call_count == 2
+        
+        context = conversation_manager_user1.get_conversation(conv_id).context
+        assert context["highlights"] == ["Key point"]
+        assert "last_research_message_id" in context
+    
     def test_add_highlight_enforces_limit(self, db_session, conversation_manager_user1, monkeypatch):
         """Test that highlight storage respects the maximum configured limit."""
         conv_id = conversation_manager_user1.create_conversation("Highlight Limit Conversation")
@@ -189,6 +189,106 @@ class TestDocumentRetrieverPostgres:
         
         assert "Failed to retrieve documents" in str(exc_info.value)
     
+    @patch('agents.research.document_retriever.retrieve_similar_embeddings')
+    def test_retrieve_many_searches_repeated_queries_once(self, mock_retrieve_embeddings, retriever):
+        """Test repeated queries in one batch share a search but get independent copies."""
+        mock_retrieve_embeddings.return_value = [
+            {
+                "id": "emb-1",
+                "message_id": "msg-1",
+                "user_id": 1,
+                "metadata": {"text": "Cached text content.", "title": "Doc"},
+                "created_at": "2023-01-01T00:00:00",
+                "similarity_score": 0.9
+            }
+        ]
+        
+        first, second = retriever.retrieve_many(["Test Query", "  Test   Query "], top_k=3)
+        first[0]["title"] = "mutated"
+        
+        assert second[0]["title"] == "Doc"
+        mock_retrieve_embeddings.assert_called_once()
+        retriever.model.encode.assert_called_once()
+    
+    @patch('agents.research.document_retriever.retrieve_similar_embeddings')
+    def test_retrieve_searches_on_every_call(self, mock_retrieve_embeddings, retriever):
+        """Test separate calls always hit the database so newly uploaded documents are seen."""
+        mock_retrieve_embeddings.return_value = []
+        
+        retriever.retrieve("test query")
+        retriever.retrieve("test query")
+        
+        assert mock_retrieve_embeddings.call_count == 2
+        retriever.model.encode.assert_called_once()
+    
+    @patch('agents.research.document_retriever.retrieve_similar_embeddings')
+    def test_query_embedding_shared_across_retrievers(self, mock_retrieve_embeddings, mock_db_session, mock_model):
+        """Test query embeddings are cached per model across retriever instances."""
+        mock_retrieve_embeddings.return_value = []
+        
+        DocumentRetriever(mock_db_session, mock_model, user_id=1).retrieve("shared query")
+        DocumentRetriever(mock_db_session, mock_model, user_id=2).retrieve("shared query")
+        
+        mock_model.encode.assert_called_once_with(["shared query"], normalize_embeddings=True)
+        assert mock_retrieve_embeddings.call_count == 2
+    
+    @patch('agents.research.document_retriever.retrieve_similar_embeddings')
+    def test_query_embedding_ignores_whitespace(self, mock_retrieve_embeddings, mock_db_session, mock_model):
+        """Test queries differing only in whitespace share one cached embedding."""
+        mock_retrieve_embeddings.return_value = []
+        retriever = DocumentRetriever(mock_db_session, mock_model, user_id=1)
+        
+        retriever.retrieve("  what is   attention? ")
+        retriever.retrieve("what is attention?")
+        retriever.retrieve_many(["what is\nattention?"])
+        
+        mock_model.encode.assert_called_once_with(["what is attention?"], normalize_embeddings=True)
+    
+    @patch('agents.research.document_retriever.retrieve_similar_embeddings')
+    def test_retrieve_many_batches_embeddings(self, mock_retrieve_embeddings, retriever):
+        """Test uncached queries are embedded in one batch and results keep query order."""
+        retriever.model.encode.side_effect = lambda texts, normalize_embeddings: [[0.1] * 1536 for _ in texts]
+        mock_retrieve_embeddings.side_effect = lambda db_session, user_id, query_vector, k: [
+            {
+                "id": f"emb-{mock_retrieve_embeddings.call_count}",
+                "message_id": "msg-1",
+                "user_id": 1,
+                "metadata": {"text": "Some text content.", "title": "Doc"},
+                "created_at": "2023-01-01T00:00:00",
+                "similarity_score": 0.9
+            }
+        ]
+        retriever.retrieve("cached query", top_k=2)
+        retriever.model.encode.reset_mock()
+        
+        results = retriever.retrieve_many(["first query", "cached query", "second query", "first query"], top_k=2)
+        
+        retriever.model.encode.assert_called_once_with(["first query", "second query"], normalize_embeddings=True)
+        assert [r[0]["doc_id"] for r in results] == ["emb-2", "emb-3", "emb-4", "emb-2"]
+        assert mock_retrieve_embeddings.call_count == 4
+    
+    def test_get_collection_stats_single_round_trip(self, retriever):
+        """Test collection statistics are read from one aggregate statement."""
+        retriever.db_session.execute.return_value.one.return_value = Mock(
+            total_documents=100, unique_files=3, file_types={".txt": 60, ".pdf": 40}
+        )
+        
+        stats = retriever.get_collection_stats()
+        
+        assert stats["total_documents"] == 100
+        assert stats["unique_files"] == 3
+        assert stats["file_types"] == {".txt": 60, ".pdf": 40}
+        assert stats["collection_name"] == "postgres_embeddings"
+        retriever.db_session.execute.assert_called_once()
+    
+    def test_get_collection_stats_without_file_types(self, retriever):
+        """Test an empty file type aggregate is reported as an empty dict."""
+        retriever.db_session.execute.return_value.one.return_value = Mock(
+            total_documents=0, unique_files=0, file_types=None
+        )
+        
+        assert retriever.get_collection_stats()["file_types"] == {}
+    
     @patch('agents.research.document_retriever.get_embedding_stats')
     def test_get_collection_stats_success(self, mock_get_stats, retriever):
         """Test getting collection statistics successfully."""
@@ -5,9 +5,10 @@ Tests for Postgres + pgvector embedding storage functionality.
 import pytest
 import numpy as np
 from sqlalchemy.orm import Session
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 from agents.shared.exceptions import AgentError
 from embedding_storage import (
+    EMBEDDING_DIM,
     store_embedding,
     retrieve_similar_embeddings,
     get_embedding_stats,
@@ -111,6 +112,40 @@ class TestEmbeddingStorage:
         
         assert "Vector contains NaN or infinite values" in str(exc_info.value)
     
+    def test_store_embedding_normalizes_vector(self, mock_db_session, sample_metadata):
+        """Test stored vectors are unit length so inner product search ranks by cosine."""
+        vector = [3.0] + [0.0] * (EMBEDDING_DIM - 2) + [4.0]
+        
+        with patch('embedding_storage.EmbeddingDB') as mock_embedding_db:
+            mock_embedding_db.return_value.id = "test-id-123"
+            
+            store_embedding(
+                db_session=mock_db_session,
+                user_id=1,
+                message_id="msg-123",
+                vector=vector,
+                metadata=sample_metadata
+            )
+        
+        stored = mock_embedding_db.call_args.kwargs['vector']
+        assert stored[0] == pytest.approx(0.6)
+        assert stored[-1] == pytest.approx(0.8)
+        assert np.linalg.norm(stored) == pytest.approx(1.0)
+    
+    def test_store_embedding_zero_vector(self, mock_db_session, sample_metadata):
+        """Test embedding storage rejects zero vectors, which have no direction."""
+        with pytest.raises(AgentError) as exc_info:
+            store_embedding(
+                db_session=mock_db_session,
+                user_id=1,
+                message_id="msg-123",
+                vector=[0.0] * EMBEDDING_DIM,
+                metadata=sample_metadata
+            )
+        
+        assert "Vector cannot be all zeros" in str(exc_info.value)
+        mock_db_session.add.assert_not_called()
+    
     def test_store_embedding_database_error(self, mock_db_session, sample_vector, sample_metadata):
         """Test embedding storage with database error."""
         # Mock database error
@@ -154,6 +189,25 @@ class TestEmbeddingStorage:
         assert results[0]["similarity_score"] == 0.95
         mock_db_session.execute.assert_called_once()
     
+    def test_retrieve_similar_embeddings_restores_order(self, mock_db_session):
+        """Test rows from a relaxed-order index scan come back most similar first."""
+        rows = [
+            Mock(id=f"emb-{score}", message_id="msg-1", user_id=1, embedding_metadata={},
+                 created_at=None, similarity_score=score)
+            for score in (0.80, 0.95, 0.90)
+        ]
+        query = mock_db_session.query.return_value.filter.return_value
+        query.order_by.return_value.limit.return_value.all.return_value = rows
+        
+        results = retrieve_similar_embeddings(
+            db_session=mock_db_session,
+            user_id=1,
+            query_vector=[0.1] * EMBEDDING_DIM,
+            k=3
+        )
+        
+        assert [r["similarity_score"] for r in results] == [0.95, 0.90, 0.80]
+    
     def test_retrieve_similar_embeddings_invalid_query(self, mock_db_session):
         """Test embedding retrieval with invalid query vector."""
         invalid_vector = [0.1] * 100  # Wrong dimension
@@ -182,6 +236,17 @@ class TestEmbeddingStorage:
         
         assert "Failed to retrieve similar embeddings" in str(exc_info.value)
     
+    def test_get_embedding_stats_single_query(self, mock_db_session):
+        """Test per-user statistics come from one aggregate query."""
+        mock_db_session.query.return_value.filter.return_value.one.return_value = (25, 10)
+        
+        stats = get_embedding_stats(mock_db_session, user_id=1)
+        
+        assert stats["total_embeddings"] == 25
+        assert stats["unique_messages"] == 10
+        assert stats["embedding_dimension"] == EMBEDDING_DIM
+        mock_db_session.query.assert_called_once()
+    
     def test_get_embedding_stats_success(self, mock_db_session):
         """Test successful embedding statistics retrieval."""
         # Mock count query result
@@ -3,10 +3,13 @@ Tests for research agent components.
 """
 
 import pytest
+import numpy as np
 from unittest.mock import Mock, patch
-from agents.research import ResearchAgent, QueryPlanner, DocumentRetriever, AnswerSynthesizer
+from agents.research import ResearchAgent, QueryPlanner, DocumentRetriever, AnswerSynthesizer, SemanticCache
+from agents.research.research_agent import NO_DOCUMENTS_ANSWER
 from agents.shared.models import ResearchResult, SubqueryResult
 from agents.shared.exceptions import AgentError, RetrievalError
+from agents.shared.interfaces import IRetriever
 
 
 class TestQueryPlanner:
@@ -58,6 +61,28 @@ class TestQueryPlanner:
         subquery_text = ' '.join(subqueries).lower()
         assert any('comparison' in sq or 'difference' in sq for sq in subqueries)
     
+    def test_generate_subqueries_limits_across_patterns(self):
+        """Test that templates from several patterns are combined in order and capped."""
+        planner = QueryPlanner()
+        subqueries = planner.generate_subqueries("What are the best machine learning tools?")
+        
+        assert subqueries == [
+            "definition of best machine learning tools",
+            "what is best machine learning tools",
+            "explain best machine learning tools",
+            "overview of best machine learning tools",
+            "best best machine learning tools"
+        ]
+    
+    def test_generate_subqueries_generic_fallback(self):
+        """Test generic subqueries when no pattern matches."""
+        planner = QueryPlanner()
+        subqueries = planner.generate_subqueries("Quantum computing")
+        
+        assert subqueries[0] == "what is quantum computing"
+        assert subqueries[1] == "how does quantum computing work"
+        assert len(subqueries) == 5
+    
     def test_extract_key_terms(self):
         """Test key term extraction."""
         planner = QueryPlanner()
@@ -245,6 +270,18 @@ class TestAnswerSynthesizer:
         
         assert "couldn't find enough information" in answer.lower()
     
+    def test_synthesize_answer_without_findings(self):
+        """Test rule-based synthesis when no subquery found relevant information."""
+        synthesizer = AnswerSynthesizer()
+        subquery_results = [
+            SubqueryResult("sq1", "No relevant information found for this aspect.", [], False),
+            SubqueryResult("sq2", "", [], False)
+        ]
+        
+        answer = synthesizer.synthesize_answer("Test question", subquery_results)
+        
+        assert "couldn't extract meaningful information" in answer
+    
     def test_summarize_documents_rule_based(self):
         """Test rule-based document summarization."""
         synthesizer = AnswerSynthesizer()
@@ -267,6 +304,31 @@ class TestAnswerSynthesizer:
         assert 'machine learning' in summary.lower()
         assert 'artificial intelligence' in summary.lower()
     
+    def test_summarize_documents_batch_with_llm(self, mock_llm_client):
+        """Test batched summarization uses one call per batch."""
+        mock_llm_client.summarize_batch.return_value = {"0": "Summary A", "1": "Summary B"}
+        synthesizer = AnswerSynthesizer(mock_llm_client)
+        
+        documents = [[{'title': 'Doc A', 'full_text': 'Text A'}], [{'title': 'Doc B', 'full_text': 'Text B'}]]
+        summaries = synthesizer.summarize_documents_batch(documents, ["query a", "query b"])
+        
+        assert summaries == ["Summary A", "Summary B"]
+        mock_llm_client.summarize_batch.assert_called_once()
+        mock_llm_client.generate_text.assert_not_called()
+        assert synthesizer.batch_stats == {'batched': 2, 'fallbacks': 0}
+    
+    def test_summarize_documents_batch_fallback(self, mock_llm_client):
+        """Test batched summarization falls back per subquery on missing output."""
+        mock_llm_client.summarize_batch.return_value = {"0": "Summary A"}
+        synthesizer = AnswerSynthesizer(mock_llm_client)
+        
+        documents = [[{'title': 'Doc A', 'full_text': 'Text A'}], [{'title': 'Doc B', 'full_text': 'Text B'}]]
+        summaries = synthesizer.summarize_documents_batch(documents, ["query a", "query b"])
+        
+        assert summaries == ["Summary A", "Test response from LLM"]
+        mock_llm_client.generate_text.assert_called_once()
+        assert synthesizer.batch_stats == {'batched': 1, 'fallbacks': 1}
+    
     def test_summarize_documents_no_documents(self):
         """Test document summarization with no documents."""
         synthesizer = AnswerSynthesizer()
@@ -289,6 +351,17 @@ class TestAnswerSynthesizer:
         assert 'This is sentence two' in sentences
         assert 'This is sentence three' in sentences
     
+    def test_split_into_sentences_strips_and_filters(self):
+        """Test sentences are stripped and fragments of 10 characters or fewer dropped."""
+        synthesizer = AnswerSynthesizer()
+        text = "  Short one.\n\tA much longer sentence here...  Tiny!?  Trailing text without a stop  "
+        
+        assert synthesizer._split_into_sentences(text) == [
+            "A much longer sentence here",
+            "Trailing text without a stop"
+        ]
+        assert synthesizer._split_into_sentences("Exactly10c. Exactly 11c.") == ["Exactly 11c"]
+    
     def test_select_relevant_sentences(self):
         """Test relevant sentence selection."""
         synthesizer = AnswerSynthesizer()
@@ -305,6 +378,36 @@ class TestAnswerSynthesizer:
         assert isinstance(relevant, list)
         assert "Machine learning is a subset of artificial intelligence." in relevant
         assert "Deep learning uses neural networks for pattern recognition." in relevant
+    
+    def test_select_relevant_sentences_ranking(self):
+        """Test sentences are ranked by overlap with ties in original order."""
+        synthesizer = AnswerSynthesizer()
+        sentences = [
+            "Neural networks are common.",
+            "Nothing relevant here.",
+            "Machine learning uses neural networks.",
+            "Machine learning is popular."
+        ]
+        
+        relevant = synthesizer._select_relevant_sentences(sentences, "machine learning neural networks")
+        
+        assert relevant == [
+            "Machine learning uses neural networks.",
+            "Neural networks are common."
+        ]
+    
+    def test_summarize_reuses_sentence_tokens(self):
+        """Test that a document shared by several subqueries is tokenized once."""
+        synthesizer = AnswerSynthesizer()
+        documents = [{'title': 'Doc', 'full_text': 'Machine learning uses data. Neural networks learn patterns.'}]
+        
+        with patch.object(synthesizer, '_split_into_sentences', wraps=synthesizer._split_into_sentences) as split:
+            first = synthesizer.summarize_documents(documents, "machine learning")
+            second = synthesizer.summarize_documents(documents, "neural networks")
+        
+        assert split.call_count == 1
+        assert first == "Machine learning uses data"
+        assert second == "Neural networks learn patterns"
 
 
 class TestResearchAgent:
@@ -346,6 +449,78 @@ class TestResearchAgent:
         assert len(result.subqueries) > 0
         assert result.processing_time > 0
     
+    def test_process_preserves_subquery_order(self, mock_retriever):
+        """Test that per-subquery retrieval keeps the original order."""
+        mock_retriever.retrieve.side_effect = lambda query, top_k=3: [
+            {'title': query, 'full_text': f'Content about {query} in detail.', 'score': 0.9}
+        ]
+        
+        agent = ResearchAgent(mock_retriever, use_llm=False)
+        subqueries = ["first topic", "second topic", "third topic"]
+        
+        with patch.object(agent.query_planner, 'generate_subqueries', return_value=subqueries):
+            result = agent.process("Test question", per_sub_k=1)
+        
+        assert [sq.subquery for sq in result.subqueries] == subqueries
+        assert [c['title'] for c in result.citations] == subqueries
+        assert mock_retriever.retrieve.call_count == 3
+    
+    def test_process_isolates_subquery_failures(self, mock_retriever):
+        """Test that one failing subquery does not fail the others."""
+        def retrieve(query, top_k=3):
+            if query == "broken topic":
+                raise RuntimeError("boom")
+            return [{'doc_id': query, 'title': query, 'full_text': f'Content about {query}.', 'score': 0.9}]
+        mock_retriever.retrieve.side_effect = retrieve
+        
+        agent = ResearchAgent(mock_retriever, use_llm=False)
+        
+        with patch.object(agent.query_planner, 'generate_subqueries',
+                          return_value=["first topic", "broken topic", "third topic"]):
+            result = agent.process("Test question", per_sub_k=1)
+        
+        assert [sq.success for sq in result.subqueries] == [True, False, True]
+        assert result.subqueries[1].error == "boom"
+    
+    def test_process_batches_retrieval(self):
+        """Test that IRetriever implementations get all subqueries in one call."""
+        class BatchRetriever(IRetriever):
+            def __init__(self):
+                self.batches = []
+            
+            def retrieve(self, query, top_k=3):
+                raise AssertionError("retrieve should not be called")
+            
+            def retrieve_many(self, queries, top_k=3):
+                self.batches.append(list(queries))
+                return [[{'doc_id': q, 'title': q, 'full_text': f'Content about {q}.', 'score': 0.9}] if q != "empty" else []
+                        for q in queries]
+        
+        retriever = BatchRetriever()
+        agent = ResearchAgent(retriever, use_llm=False)
+        
+        with patch.object(agent.query_planner, 'generate_subqueries', return_value=["topic one", "empty", "topic two"]):
+            result = agent.process("Test question", per_sub_k=1)
+        
+        assert retriever.batches == [["topic one", "empty", "topic two"]]
+        assert [sq.success for sq in result.subqueries] == [True, False, True]
+        assert [c['doc_id'] for c in result.citations] == ["topic one", "topic two"]
+    
+    def test_process_deduplicates_citations(self, mock_retriever):
+        """Test that documents returned by several subqueries are cited once."""
+        mock_retriever.retrieve.side_effect = lambda query, top_k=3: [
+            {'doc_id': 'shared', 'title': 'Shared Doc', 'full_text': 'Shared content here.', 'score': 0.5},
+            {'doc_id': query, 'title': query, 'full_text': f'Content about {query}.', 'score': 0.9}
+        ]
+        
+        agent = ResearchAgent(mock_retriever, use_llm=False)
+        
+        with patch.object(agent.query_planner, 'generate_subqueries', return_value=["topic one", "topic two"]):
+            result = agent.process("Test question", per_sub_k=2)
+        
+        assert [c['doc_id'] for c in result.citations] == ['shared', 'topic one', 'topic two']
+        assert result.total_documents == 3
+    
     def test_process_with_llm(self, mock_retriever, mock_llm_client):
         """Test processing with LLM client."""
         agent = ResearchAgent(mock_retriever, mock_llm_client, use_llm=True)
@@ -360,6 +535,79 @@ class TestResearchAgent:
         assert isinstance(result, ResearchResult)
         mock_llm_client.generate_text.assert_called()
     
+    def test_process_no_documents_skips_synthesis(self, mock_retriever, mock_llm_client):
+        """Test that synthesis is skipped when no subquery retrieves documents."""
+        mock_retriever.retrieve.return_value = []
+        
+        agent = ResearchAgent(mock_retriever, mock_llm_client, use_llm=True)
+        result = agent.process("What is test?", per_sub_k=1)
+        
+        assert result.answer == NO_DOCUMENTS_ANSWER
+        assert result.total_documents == 0
+        mock_llm_client.generate_text.assert_not_called()
+    
+    def test_process_semantic_cache_hit(self, mock_retriever):
+        """Test that a similar question is answered from the semantic cache."""
+        embeddings = {
+            "What is test?": np.array([1.0, 0.0], dtype=np.float32),
+            "What's a test?": np.array([0.99, 0.141], dtype=np.float32)
+        }
+        mock_retriever.user_id = 1
+        mock_retriever.embed_query.side_effect = lambda query: embeddings[query]
+        mock_retriever.retrieve.return_value = [
+            {'doc_id': 'doc1', 'title': 'Test Doc', 'full_text': 'Test content here.', 'score': 0.9}
+        ]
+        
+        agent = ResearchAgent(mock_retriever, use_llm=False, semantic_cache=SemanticCache())
+        first = agent.process("What is test?", per_sub_k=1)
+        retrieve_calls = mock_retriever.retrieve.call_count
+        second = agent.process("What's a test?", per_sub_k=1)
+        
+        assert mock_retriever.retrieve.call_count == retrieve_calls
+        assert second.question == "What's a test?"
+        assert second.answer == first.answer
+        assert second.metadata['semantic_cache_hit'] is True
+    
+    def test_process_semantic_cache_hit_returns_copies(self, mock_retriever):
+        """Test that mutating a cached answer does not change later cache hits."""
+        mock_retriever.user_id = 1
+        mock_retriever.embed_query.return_value = np.array([1.0, 0.0], dtype=np.float32)
+        mock_retriever.retrieve.return_value = [
+            {'doc_id': 'doc1', 'title': 'Test Doc', 'full_text': 'Test content here.', 'score': 0.9}
+        ]
+        
+        agent = ResearchAgent(mock_retriever, use_llm=False, semantic_cache=SemanticCache())
+        first = agent.process("What is test?", per_sub_k=1)
+        first.citations[0]['title'] = 'mutated'
+        first.subqueries.clear()
+        second = agent.process("What is test?", per_sub_k=1)
+        second.subqueries[0].documents.clear()
+        third = agent.process("What is test?", per_sub_k=1)
+        
+        assert third.citations[0]['title'] == 'Test Doc'
+        assert third.subqueries and third.subqueries[0].documents
+    
+    def test_ask_stream_uses_semantic_cache(self, mock_retriever, mock_llm_client):
+        """Test streaming reads and fills the same semantic cache as process."""
+        mock_llm_client.generate_text_stream.return_value = iter(["Streamed ", "answer"])
+        mock_retriever.user_id = 1
+        mock_retriever.embed_query.return_value = np.array([1.0, 0.0], dtype=np.float32)
+        mock_retriever.retrieve.return_value = [
+            {'doc_id': 'doc-1', 'title': 'Test Doc', 'full_text': 'Test content', 'score': 0.9}
+        ]
+        
+        agent = ResearchAgent(mock_retriever, mock_llm_client, use_llm=True, semantic_cache=SemanticCache())
+        streamed = list(agent.ask("What is test?", per_sub_k=1, stream=True))
+        retrieve_calls = mock_retriever.retrieve.call_count
+        cached = list(agent.ask("What is test?", per_sub_k=1, stream=True))
+        
+        assert mock_retriever.retrieve.call_count == retrieve_calls
+        mock_llm_client.generate_text_stream.assert_called_once()
+        assert [c['delta'] for c in cached[1:-1]] == ["Streamed answer"]
+        assert cached[-1]['answer'] == streamed[-1]['answer'] == "Streamed answer"
+        assert cached[-1]['citations'] == streamed[-1]['citations']
+        assert agent.process("What is test?", per_sub_k=1).metadata['semantic_cache_hit'] is True
+    
     def test_ask_legacy_method(self, mock_retriever):
         """Test legacy ask method."""
         agent = ResearchAgent(mock_retriever, use_llm=False)
@@ -383,6 +631,23 @@ class TestResearchAgent:
         assert 'citations' in result
         assert 'total_documents' in result
     
+    def test_ask_stream(self, mock_retriever, mock_llm_client):
+        """Test streaming ask yields research data, answer fragments and a final result."""
+        mock_llm_client.generate_text_stream.return_value = iter(["Streamed ", "answer"])
+        mock_retriever.retrieve.return_value = [
+            {'doc_id': 'doc-1', 'title': 'Test Doc', 'full_text': 'Test content', 'score': 0.9}
+        ]
+        
+        agent = ResearchAgent(mock_retriever, mock_llm_client, use_llm=True)
+        chunks = list(agent.ask("What is test?", per_sub_k=1, stream=True))
+        
+        assert chunks[0]['done'] is False
+        assert chunks[0]['total_documents'] == 1
+        assert [c['delta'] for c in chunks[1:-1]] == ["Streamed ", "answer"]
+        assert chunks[-1]['done'] is True
+        assert chunks[-1]['answer'] == "Streamed answer"
+        assert chunks[-1]['citations'] == chunks[0]['citations']
+    
     def test_get_collection_stats(self, mock_retriever):
         """Test collection statistics retrieval."""
         mock_stats = {'total_documents': 100, 'file_types': {'txt': 50}}
@@ -403,3 +668,70 @@ class TestResearchAgent:
         with pytest.raises(AgentError):
             agent.process("Test question")
 
+
+
+class TestSemanticCache:
+    """Test SemanticCache functionality."""
+    
+    def _result(self, question="What is test?"):
+        return ResearchResult(
+            question=question,
+            answer="Test answer",
+            subqueries=[],
+            citations=[],
+            total_documents=0,
+            processing_time=0.1
+        )
+    
+    def test_hit_for_similar_embedding(self):
+        """Test that embeddings above the threshold hit the cache."""
+        cache = SemanticCache(threshold=0.9)
+        cache.put((1,), np.array([1.0, 0.0]), self._result())
+        
+        cached = cache.get((1,), np.array([0.99, 0.141]))
+        
+        assert cached is not None
+        assert cached.answer == "Test answer"
+    
+    def test_miss_below_threshold(self):
+        """Test that dissimilar embeddings miss the cache."""
+        cache = SemanticCache(threshold=0.9)
+        cache.put((1,), np.array([1.0, 0.0]), self._result())
+        
+        assert cache.get((1,), np.array([0.6, 0.8])) is None
+    
+    def test_scopes_are_isolated(self):
+        """Test that results are never shared across scopes."""
+        cache = SemanticCache()
+        cache.put((1, True), np.array([1.0, 0.0]), self._result())
+        
+        assert cache.get((2, True), np.array([1.0, 0.0])) is None
+        assert cache.get((1, False), np.array([1.0, 0.0])) is None
+    
+    def test_expired_entries_miss(self):
+        """Test that entries older than the TTL are dropped."""
+        cache = SemanticCache(ttl=0)
+        cache.put((1,), np.array([1.0, 0.0]), self._result())
+        
+        with patch('agents.research.semantic_cache.time.time', return_value=1e12):
+            assert cache.get((1,), np.array([1.0, 0.0])) is None
+    
+    def test_evicts_oldest_entry(self):
+        """Test that the least recently used entry is evicted at capacity."""
+        cache = SemanticCache(maxsize=1)
+        cache.put((1,), np.array([1.0, 0.0]), self._result("first"))
+        cache.put((1,), np.array([0.0, 1.0]), self._result("second"))
+        
+        assert cache.get((1,), np.array([1.0, 0.0])) is None
+        assert cache.get((1,), np.array([0.0, 1.0])).question == "second"
+    
+    def test_invalidate_user(self):
+        """Test that invalidating a user only drops that user's scopes."""
+        cache = SemanticCache()
+        cache.put((1, True), np.array([1.0, 0.0]), self._result())
+        cache.put((2, True), np.array([1.0, 0.0]), self._result())
+        
+        cache.invalidate(1)
+        
+        assert cache.get((1, True), np.array([1.0, 0.0])) is None
+        assert cache.get((2, True), np.array([1.0, 0.0])) is not None
@@ -2,8 +2,10 @@
 Tests for shared data models.
 """
 
+import sys
 import pytest
 from datetime import datetime
+from unittest.mock import patch
 from agents.shared.models import (
     ChatMessage, Conversation, ResearchResult, SubqueryResult, 
     ConversationInfo, ChatResponse, MessageRole
@@ -134,6 +136,34 @@ class TestConversation:
         assert recent[1].content == "Response 2"
         assert recent[2].content == "Message 3"
     
+    def test_get_first_user_messages(self):
+        """Test the leading user messages are tracked incrementally."""
+        now = datetime.now()
+        conversation = Conversation(
+            id="conv-1",
+            title="Test Conversation",
+            created_at=now,
+            updated_at=now,
+            messages=[],
+            context={}
+        )
+        
+        assert conversation.get_first_user_messages() == []
+        
+        conversation.add_message("assistant", "Hello!")
+        first = conversation.add_message("user", "First question")
+        assert conversation.get_first_user_messages() == [first]
+        
+        conversation.add_message("assistant", "Answer")
+        second = conversation.add_message("user", "Second question")
+        third = conversation.add_message("user", "Third question")
+        conversation.add_message("user", "Fourth question")
+        
+        assert conversation.get_first_user_messages() == [first, second, third]
+        assert conversation.get_first_user_messages(1) == [first]
+        assert [m.content for m in conversation.get_first_user_messages(4)][-1] == "Fourth question"
+        assert "_leading_user_messages" not in conversation.to_dict()
+    
     def test_get_conversation_summary(self):
         """Test getting conversation summary."""
         conversation = Conversation(
@@ -158,6 +188,24 @@ class TestConversation:
         assert "machine learning" in summary.lower()
         assert "conversation with 2 user messages and 1 assistant responses" in summary.lower()
     
+    def test_get_conversation_summary_skips_other_roles(self):
+        """Test the summary counts roles separately and starts from the first user message."""
+        conversation = Conversation(
+            id="conv-1",
+            title="Test Conversation",
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+            messages=[],
+            context={}
+        )
+        conversation.add_message("system", "Document upload")
+        conversation.add_message("user", "Explain vector indexes")
+        conversation.add_message("assistant", "They speed up search...")
+        
+        summary = conversation.get_conversation_summary()
+        assert summary == ("Conversation with 1 user messages and 1 assistant responses. "
+                           "Started with: Explain vector indexes...")
+    
     def test_conversation_to_dict(self):
         """Test converting Conversation to dictionary."""
         now = datetime.now()
@@ -326,6 +374,18 @@ class TestConversationInfo:
         assert info.updated_at == now.isoformat()
 
 
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="slotted dataclasses need Python 3.10+")
+def test_per_turn_models_are_slotted():
+    """Test models created on every chat turn carry no per-instance __dict__."""
+    message = ChatMessage(id="msg-1", role="user", content="Hi", timestamp=datetime.now())
+    subquery = SubqueryResult(subquery="sq", summary="summary", documents=[])
+    result = ResearchResult(question="q", answer="a", subqueries=[subquery], citations=[], total_documents=0)
+    
+    for instance in (message, subquery, result):
+        assert not hasattr(instance, '__dict__')
+    assert result.to_dict()['subqueries'][0]['subquery'] == "sq"
+
+
 class TestChatResponse:
     """Test ChatResponse model."""
     
@@ -372,3 +432,32 @@ class TestChatResponse:
         assert response.timestamp == now.isoformat()
         assert response.research_result is None
         assert response.error is None
+        assert response.research_result_to_dict() is None
+    
+    def test_chat_response_serializes_research_result_once(self):
+        """Test the research result dict is computed once and reused."""
+        research_result = ResearchResult(
+            question="Test question",
+            answer="Test answer",
+            subqueries=[],
+            citations=[],
+            total_documents=0
+        )
+        response = ChatResponse(
+            conversation_id="conv-1",
+            message_id="msg-1",
+            answer="Test answer",
+            conversation_title="Test Conversation",
+            message_count=1,
+            context_used=False,
+            timestamp=datetime.now().isoformat(),
+            research_result=research_result
+        )
+        
+        with patch.object(ResearchResult, 'to_dict', wraps=research_result.to_dict) as to_dict:
+            first = response.research_result_to_dict()
+            second = response.research_result_to_dict()
+        
+        assert first is second
+        assert first["question"] == "Test question"
+        to_dict.assert_called_once()